@@ -0,0 +1,174 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Уровни по умолчанию - быстрые настройки с хорошим сжатием для JSON/XML
+DEFAULT_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+# Порядок предпочтения сервера среди поддерживаемых клиентом кодировок
+DEFAULT_ENCODINGS = ("br", "zstd", "gzip")
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/xml", "application/x-ndjson", "application/javascript",
+                       "application/openmetrics-text", "image/svg+xml")
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    # mtime=0 - одинаковый вход дает одинаковый выход (годится для ETag и кэшей)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_codecs() -> Dict[str, Callable[[bytes, int], bytes]]:
+    codecs = {"gzip": _gzip}
+    if brotli is not None:
+        codecs["br"] = _brotli
+    if zstandard is not None:
+        codecs["zstd"] = _zstd
+    return codecs
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES or \
+        media_type.endswith("+json") or media_type.endswith("+xml")
+
+
+def choose_encoding(accept_encoding: str, encodings) -> Optional[str]:
+    """Кодировка из encodings (в порядке предпочтения сервера), которую принимает клиент (q > 0)"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            k, _, v = param.partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in encodings:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class CompressedBodyCache:
+    """
+    LRU уже сжатых тел: повторяющиеся результаты (справочники, популярные выборки) сжимаются один раз.
+    Ключ - кодировка и исходное тело, размер ограничен суммарным объемом исходных и сжатых тел.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, max_body_size: int = 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_body_size = max_body_size
+        self._items: OrderedDict[Tuple[str, bytes], bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, encoding: str, body: bytes) -> Optional[bytes]:
+        if len(body) > self.max_body_size:
+            return None
+        with self._lock:
+            r = self._items.get((encoding, body))
+            if r is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((encoding, body))
+            self.hits += 1
+            return r
+
+    def put(self, encoding: str, body: bytes, compressed: bytes):
+        size = len(body) + len(compressed)
+        if len(body) > self.max_body_size or size > self.max_bytes:
+            return
+        with self._lock:
+            key = (encoding, body)
+            if key in self._items:
+                return
+            self._items[key] = compressed
+            self._size += size
+            while self._size > self.max_bytes:
+                (_, old_body), old = self._items.popitem(last=False)
+                self._size -= len(old_body) + len(old)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+class CompressedResponse(Response):
+    """
+    Ответ, сжимаемый при отправке (в __call__), а не при создании: презентер остается синхронным, а сжатие
+    больших тел уходит в пул потоков. Сжатие выполняется один раз; render_body сжимает тело заранее
+    (например, перед помещением в кэш результатов).
+    """
+
+    def __init__(self, source: Response, encoding: str, compress: Callable[[bytes], bytes],
+                 cache: Optional[CompressedBodyCache] = None, offload_min_size: int = 64 * 1024):
+        self.status_code = source.status_code
+        self.background = source.background
+        self.media_type = source.media_type
+        self.body = source.body
+        self.raw_headers = list(source.raw_headers)
+        self._source = source
+        self.encoding = encoding
+        self._compress = compress
+        self._cache = cache
+        self._offload_min_size = offload_min_size
+        self._compressed = False
+
+    async def compress(self):
+        if self._compressed:
+            return
+        render_body = getattr(self._source, "render_body", None)
+        if render_body is not None:
+            # Тело источника рендерится при отправке (см. presenters.ThreadpoolRenderedResponse)
+            await render_body()
+            self.body = self._source.body
+        body = bytes(self.body)
+        compressed = self._cache.get(self.encoding, body) if self._cache is not None else None
+        if compressed is None:
+            if len(body) >= self._offload_min_size:
+                compressed = await run_in_threadpool(self._compress, body)
+            else:
+                compressed = self._compress(body)
+            if self._cache is not None:
+                self._cache.put(self.encoding, body, compressed)
+        if self._compressed:
+            # Параллельная отправка того же объекта уже сжала тело
+            return
+        self.body = compressed
+        self.headers["content-encoding"] = self.encoding
+        self.headers["content-length"] = str(len(compressed))
+        self._compressed = True
+
+    async def render_body(self):
+        await self.compress()
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.compress()
+        await super().__call__(scope, receive, send)
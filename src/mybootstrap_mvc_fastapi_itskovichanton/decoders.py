@@ -0,0 +1,325 @@
+import codecs
+import collections.abc
+import dataclasses
+import json
+import threading
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dacite import from_dict, Config, MissingValueError
+
+Decoder = Callable[[Any], Any]
+
+_CONFIG = Config(check_types=False)
+_MAPPING_ORIGINS = (dict, collections.abc.Mapping, collections.abc.MutableMapping)
+_SEQUENCE_ORIGINS = (list, set, frozenset, collections.abc.Sequence, collections.abc.MutableSequence,
+                     collections.abc.Collection, collections.abc.Iterable, collections.abc.Set,
+                     collections.abc.MutableSet)
+_NONE_TYPE = type(None)
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+def _identity(v: Any) -> Any:
+    return v
+
+
+class DecoderRegistry:
+    """
+    Кэш декодеров по целевым типам: приведение разобранного JSON к dataclass'ам (и коллекциям из них)
+    с семантикой dacite.from_dict(..., Config(check_types=False)).
+
+    Декодер строится при первой встрече типа: для dataclass генерируется функция с прямым разбором полей,
+    подсказки типов разбираются один раз. То, что так не покрывается (Union из нескольких типов, InitVar,
+    поля с init=False, обобщенные dataclass'ы), декодируется dacite с закэшированной оберткой.
+    """
+
+    def __init__(self):
+        self._decoders: Dict[Any, Decoder] = {}
+        self._building = set()
+        self._lock = threading.RLock()
+
+    def decode(self, data: Any, t: Any) -> Any:
+        f = self._decoders.get(t)
+        if f is None:
+            f = self.decoder_for(t)
+        return f(data)
+
+    def decoder_for(self, t: Any) -> Decoder:
+        f = self._decoders.get(t)
+        if f is not None:
+            return f
+        with self._lock:
+            f = self._decoders.get(t)
+            if f is not None:
+                return f
+            if t in self._building:
+                # Рекурсивный тип: ссылаемся на декодер, который достроится позже
+                return lambda v: self._decoders[t](v)
+            self._building.add(t)
+            try:
+                f = self._decoders[t] = self._build(t)
+            finally:
+                self._building.discard(t)
+            return f
+
+    # --- Построение декодеров ---
+
+    def _build(self, t: Any) -> Decoder:
+        if t is Any or isinstance(t, (str, typing.ForwardRef, typing.TypeVar)):
+            return _identity
+        origin = typing.get_origin(t)
+        if origin is typing.Union or (origin is not None and origin.__name__ == "UnionType"):
+            args = typing.get_args(t)
+            if len(args) == 2 and _NONE_TYPE in args:
+                f = self.decoder_for(args[0] if args[1] is _NONE_TYPE else args[1])
+                return _identity if f is _identity else lambda v: None if v is None else f(v)
+            return self._dacite_decoder(t)
+        if origin is not None:
+            return self._collection_decoder(t, origin)
+        if dataclasses.is_dataclass(t) and isinstance(t, type):
+            return self._dataclass_decoder(t)
+        return _identity
+
+    def _collection_decoder(self, t: Any, origin: Any) -> Decoder:
+        args = typing.get_args(t)
+        if origin in _MAPPING_ORIGINS:
+            f = self.decoder_for(args[1]) if len(args) == 2 else _identity
+            if f is _identity:
+                return _identity
+
+            def decode_mapping(v):
+                if type(v) is dict:
+                    return {k: f(x) for k, x in v.items()}
+                if isinstance(v, collections.abc.Mapping):
+                    return type(v)((k, f(x)) for k, x in v.items())
+                return v
+
+            return decode_mapping
+        if origin is tuple:
+            if len(args) == 2 and args[1] is Ellipsis:
+                f = self.decoder_for(args[0])
+                if f is _identity:
+                    return _identity
+                return lambda v: type(v)(f(x) for x in v) if isinstance(v, (list, tuple)) else v
+            return self._dacite_decoder(t)
+        if origin in _SEQUENCE_ORIGINS:
+            f = self.decoder_for(args[0]) if args else _identity
+            if f is _identity:
+                return _identity
+
+            def decode_sequence(v):
+                if type(v) is list:
+                    return [f(x) for x in v]
+                if isinstance(v, (tuple, set, frozenset)):
+                    return type(v)(f(x) for x in v)
+                return v
+
+            return decode_sequence
+        return self._dacite_decoder(t)
+
+    def _dacite_decoder(self, t: Any) -> Decoder:
+        wrapped = dataclasses.make_dataclass("_Wrapped", [("value", t)])
+        return lambda v: from_dict(data_class=wrapped, data={"value": v}, config=_CONFIG).value
+
+    def _dataclass_decoder(self, t: type) -> Decoder:
+        fields = dataclasses.fields(t)
+        if len(fields) != len(t.__dataclass_fields__) or not all(f.init for f in fields):
+            return lambda v: from_dict(data_class=t, data=v, config=_CONFIG) \
+                if isinstance(v, collections.abc.Mapping) else v
+        try:
+            hints = typing.get_type_hints(t)
+        except NameError:
+            # Неразрешимая ссылка вперед - dacite сообщит об ошибке как обычно
+            return lambda v: from_dict(data_class=t, data=v, config=_CONFIG) \
+                if isinstance(v, collections.abc.Mapping) else v
+
+        namespace = {"cls": t, "Mapping": collections.abc.Mapping, "MissingValueError": MissingValueError}
+        args = []
+        required = []
+        for i, f in enumerate(fields):
+            value = f"d[{f.name!r}]"
+            decoder = self.decoder_for(hints[f.name])
+            if decoder is not _identity:
+                namespace[f"f{i}"] = decoder
+                value = f"f{i}({value})"
+            # Отсутствующее поле - как в dacite: значение по умолчанию, None для Optional, иначе ошибка
+            if f.default is not dataclasses.MISSING:
+                namespace[f"default{i}"] = f.default
+                value = f"{value} if {f.name!r} in d else default{i}"
+            elif f.default_factory is not dataclasses.MISSING:
+                namespace[f"factory{i}"] = f.default_factory
+                value = f"{value} if {f.name!r} in d else factory{i}()"
+            elif _is_optional(hints[f.name]):
+                value = f"{value} if {f.name!r} in d else None"
+            else:
+                required.append(f.name)
+            args.append(f"{f.name}={value}" if getattr(f, "kw_only", False) else value)
+        namespace["required"] = tuple(required)
+        lines = ["def decode_dataclass(d):",
+                 "    if type(d) is not dict and not isinstance(d, Mapping):",
+                 "        return d",
+                 "    try:",
+                 f"        return cls({', '.join(args)})",
+                 "    except KeyError:",
+                 "        for name in required:",
+                 "            if name not in d:",
+                 "                raise MissingValueError(name) from None",
+                 "        raise"]
+        exec("\n".join(lines), namespace)
+        return namespace["decode_dataclass"]
+
+
+def _is_optional(t: Any) -> bool:
+    origin = typing.get_origin(t)
+    return (origin is typing.Union or (origin is not None and origin.__name__ == "UnionType")) and \
+        _NONE_TYPE in typing.get_args(t)
+
+
+_registry = DecoderRegistry()
+
+
+def decoder_for(t: Any) -> Decoder:
+    return _registry.decoder_for(t)
+
+
+def decode(data: Any, t: Any) -> Any:
+    """Приведение разобранных данных к типу t (dataclass, list[dataclass], dict[str, dataclass], ...)"""
+    return _registry.decode(data, t)
+
+
+# --- Потоковый разбор ---
+
+class ResultStreamParser:
+    """
+    Инкрементальный разбор JSON-объекта ответа ({"error": ..., "result": [...]}) по мере прихода байтов.
+
+    Элементы массива result отдаются по одному, не дожидаясь конца тела, поэтому большой ответ не собирается
+    в памяти целиком. Остальные поля верхнего уровня (error, detail, ...) накапливаются в members.
+    Каждое значение разбирается json.raw_decode (C-сканером) целиком; незаконченное значение повторно
+    разбирается, только когда недостающая часть буфера как минимум удвоилась.
+    """
+
+    # Состояния разбора объекта верхнего уровня
+    _START, _KEY, _COLON, _VALUE, _FIRST_ITEM, _ITEM, _AFTER_ITEM, _AFTER_VALUE, _END = range(9)
+
+    def __init__(self, key: str = "result"):
+        self.key = key
+        self.members: Dict[str, Any] = {}
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = self._START
+        self._key: Optional[str] = None
+        # Сколько данных должно накопиться, чтобы повторить разбор незаконченного значения
+        self._retry_len = 0
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Очередная порция тела; возвращает элементы result, разобранные полностью"""
+        self._buf = self._buf[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+        if len(self._buf) < self._retry_len:
+            return []
+        return self._parse(final=False)
+
+    def close(self) -> List[Any]:
+        """Конец тела; возвращает оставшиеся элементы (ошибка, если JSON оборван)"""
+        self._buf = self._buf[self._pos:] + self._text.decode(b"", final=True)
+        self._pos = 0
+        items = self._parse(final=True)
+        if self._state != self._END:
+            raise json.JSONDecodeError("Unexpected end of JSON", self._buf, self._pos)
+        return items
+
+    def _skip_ws(self) -> Optional[str]:
+        buf = self._buf
+        n = len(buf)
+        while self._pos < n and buf[self._pos] in " \t\r\n":
+            self._pos += 1
+        return buf[self._pos] if self._pos < n else None
+
+    def _value(self, final: bool) -> Tuple[bool, Any]:
+        """Разбор значения с текущей позиции; (False, None), если для него не хватает данных"""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            self._retry_len = 2 * (len(self._buf) - self._pos)
+            return False, None
+        # Число (или литерал) в конце порции могло быть обрезано ("2" из "2.5") - ждем разделитель после него
+        if not final and (end == len(self._buf) or self._buf[end] in _NUMBER_CHARS):
+            self._retry_len = len(self._buf) - self._pos + 1
+            return False, None
+        self._retry_len = 0
+        self._pos = end
+        return True, value
+
+    def _expect(self, c: Optional[str], expected: str):
+        if c != expected:
+            raise json.JSONDecodeError(f"Expecting '{expected}'", self._buf, self._pos)
+        self._pos += 1
+
+    def _parse(self, final: bool) -> List[Any]:
+        items = []
+        while True:
+            c = self._skip_ws()
+            if c is None or self._state == self._END:
+                if c is not None:
+                    raise json.JSONDecodeError("Extra data", self._buf, self._pos)
+                return items
+            state = self._state
+            if state == self._START:
+                self._expect(c, "{")
+                self._state = self._KEY
+            elif state == self._KEY:
+                if c == "}":
+                    self._pos += 1
+                    self._state = self._END
+                    continue
+                ok, key = self._value(final)
+                if not ok:
+                    return items
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name", self._buf, self._pos)
+                self._key = key
+                self._state = self._COLON
+            elif state == self._COLON:
+                self._expect(c, ":")
+                self._state = self._VALUE
+            elif state == self._VALUE:
+                if self._key == self.key and c == "[":
+                    self._pos += 1
+                    self._state = self._FIRST_ITEM
+                    continue
+                ok, value = self._value(final)
+                if not ok:
+                    return items
+                self.members[self._key] = value
+                self._state = self._AFTER_VALUE
+            elif state == self._FIRST_ITEM and c == "]":
+                self._pos += 1
+                self._state = self._AFTER_VALUE
+            elif state in (self._FIRST_ITEM, self._ITEM):
+                ok, value = self._value(final)
+                if not ok:
+                    return items
+                items.append(value)
+                self._state = self._AFTER_ITEM
+            elif state == self._AFTER_ITEM:
+                self._pos += 1
+                if c == ",":
+                    self._state = self._ITEM
+                elif c == "]":
+                    self._state = self._AFTER_VALUE
+                else:
+                    raise json.JSONDecodeError("Expecting ',' or ']'", self._buf, self._pos - 1)
+            elif state == self._AFTER_VALUE:
+                self._pos += 1
+                if c == ",":
+                    self._state = self._KEY
+                elif c == "}":
+                    self._state = self._END
+                else:
+                    raise json.JSONDecodeError("Expecting ',' or '}'", self._buf, self._pos - 1)
+
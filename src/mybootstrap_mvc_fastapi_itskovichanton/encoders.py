@@ -0,0 +1,376 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import operator
+import threading
+import uuid
+from contextvars import ContextVar
+from pathlib import PurePath
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.types import IncEx
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+BINARY_MEDIA_TYPES = MSGPACK_MEDIA_TYPES + (CBOR_MEDIA_TYPE,)
+
+# Типы, которые orjson сериализует сам - оставляем как есть
+_NATIVE_TYPES = (str, int, float, bool, type(None), datetime.datetime, datetime.date, datetime.time, uuid.UUID)
+# Типы, которые без преобразования сериализует стандартный json
+_JSON_TYPES = (str, int, float, bool, type(None))
+
+Encoder = Callable[[Any], Any]
+
+# Отчет о полях, закодированных с ошибкой (собирается, если его запросил вызывающий)
+_degraded: ContextVar[Optional[List[str]]] = ContextVar("degraded_fields", default=None)
+_DROP = object()
+
+
+def _identity(o: Any) -> Any:
+    return o
+
+
+def _degrade(owner: str, key: Any, value: Any, ex: BaseException) -> Any:
+    """Замена значения, которое не удалось закодировать: его строковое представление, а если нет и его - пропуск"""
+    if isinstance(ex, RecursionError):
+        # Циклическая ссылка заменой одного поля не лечится - прерываем кодирование целиком
+        raise ex
+    try:
+        r = str(value)
+    except Exception:
+        r = _DROP
+    report = _degraded.get()
+    if report is not None:
+        report.append(f"{owner}.{key}: {type(ex).__name__}: {ex}" + (" (dropped)" if r is _DROP else ""))
+    return r
+
+
+def _sub_spec(spec: Any, key: Any) -> Any:
+    """Вложенная спецификация include/exclude для ключа (индекса): None - ключ целиком, иначе set/dict"""
+    if not isinstance(spec, dict):
+        return None
+    sub = spec.get(key, spec.get("__all__"))
+    return None if sub is True or sub is ... else sub
+
+
+def _in_spec(spec: Any, key: Any) -> bool:
+    return key in spec or (isinstance(spec, dict) and "__all__" in spec)
+
+
+def _filter_keys(v: Any, include: Optional[IncEx], exclude: Optional[IncEx]) -> Any:
+    """
+    Применение include/exclude к закодированному значению с той же семантикой, что у model_dump (через него
+    их применяет jsonable_encoder): set - ключи целиком, dict - вложенные спецификации для значений ключей
+    (для списков - по индексам или "__all__"), True/... в dict - ключ целиком.
+    """
+    if isinstance(v, dict):
+        items = v.items()
+    elif isinstance(v, list):
+        items = enumerate(v)
+    else:
+        return v
+    r = []
+    for k, x in items:
+        if include is not None and not _in_spec(include, k):
+            continue
+        sub_exclude = _sub_spec(exclude, k) if exclude is not None else None
+        if exclude is not None and sub_exclude is None and _in_spec(exclude, k):
+            continue
+        sub_include = _sub_spec(include, k) if include is not None else None
+        if sub_include is not None or sub_exclude is not None:
+            x = _filter_keys(x, sub_include, sub_exclude)
+        r.append((k, x))
+    return dict(r) if isinstance(v, dict) else [x for _, x in r]
+
+
+class EncoderRegistry:
+    """
+    Кэш кодировщиков по типам.
+
+    Кодировщик строится при первой встрече типа и дальше переиспользуется: для dataclass - замыкание над
+    заранее собранным списком полей, для pydantic-моделей - замыкание над model_dump с опциями реестра. Отражение
+    (fields/__dict__/isinstance-цепочки) выполняется один раз на тип, а не на каждый объект.
+
+    Ошибка кодирования не прерывает проход: значение поля (элемента списка, ключа словаря), на котором она
+    произошла, заменяется строкой или пропускается, остальное кодируется как обычно.
+
+    json_compatible=True приводит даты, UUID и т.п. к строкам (для стандартного json), иначе они оставляются
+    как есть для orjson.
+    """
+
+    def __init__(self, exclude_none: bool = True, by_alias: bool = True, exclude_unset: bool = False,
+                 exclude_defaults: bool = False, custom_encoder: Optional[Dict[Any, Encoder]] = None,
+                 sqlalchemy_safe: bool = False, json_compatible: bool = False):
+        self.exclude_none = exclude_none
+        self.by_alias = by_alias
+        self.exclude_unset = exclude_unset
+        self.exclude_defaults = exclude_defaults
+        self.custom_encoder = dict(custom_encoder or {})
+        self.sqlalchemy_safe = sqlalchemy_safe
+        self.json_compatible = json_compatible
+        # Типы, значения которых подставляются без вызова кодировщика
+        self._passthrough = frozenset(t for t in (_JSON_TYPES if json_compatible else _NATIVE_TYPES)
+                                      if self._find_custom(t) is None)
+        self._encoders: Dict[type, Encoder] = {t: _identity for t in self._passthrough}
+
+    def encode(self, obj: Any) -> Any:
+        f = self._encoders.get(type(obj))
+        if f is None:
+            f = self.encoder_for(type(obj))
+        return f(obj)
+
+    def encode_many(self, objs, degraded: Optional[List[str]] = None) -> list:
+        """Кодирование последовательности объектов с общим отчетом о деградировавших полях (см. to_jsonable)"""
+        token = _degraded.set(degraded)
+        try:
+            return [self._encode_root(o) for o in objs]
+        finally:
+            _degraded.reset(token)
+
+    def _encode_root(self, obj: Any) -> Any:
+        try:
+            return self.encode(obj)
+        except RecursionError:
+            raise
+        except Exception as ex:
+            r = _degrade(type(obj).__name__, "", obj, ex)
+            return None if r is _DROP else r
+
+    def encoder_for(self, t: type) -> Encoder:
+        f = self._encoders.get(t)
+        if f is None:
+            f = self._encoders[t] = self._build(t)
+        return f
+
+    def _find_custom(self, t: type) -> Optional[Encoder]:
+        if not self.custom_encoder:
+            return None
+        f = self.custom_encoder.get(t)
+        if f is None:
+            for base, encoder in self.custom_encoder.items():
+                if isinstance(base, type) and issubclass(t, base):
+                    return encoder
+        return f
+
+    # --- Построение кодировщиков ---
+
+    def _build(self, t: type) -> Encoder:
+        enc = self.encode
+        custom = self._find_custom(t)
+        if custom is not None:
+            return lambda o: enc(custom(o))
+        if issubclass(t, enum.Enum):
+            return lambda o: enc(o.value)
+        if issubclass(t, dict):
+            return self._dict_encoder(t.__name__)
+        if issubclass(t, (list, tuple, set, frozenset)):
+            return self._list_encoder(t.__name__)
+        if issubclass(t, BaseModel):
+            return self._model_encoder(t)
+        if dataclasses.is_dataclass(t):
+            return self._dataclass_encoder(t)
+        if self.json_compatible:
+            if issubclass(t, (datetime.datetime, datetime.date, datetime.time)):
+                return lambda o: o.isoformat()
+            if issubclass(t, uuid.UUID):
+                return str
+        if issubclass(t, _JSON_TYPES if self.json_compatible else _NATIVE_TYPES):
+            return _identity
+        if issubclass(t, decimal.Decimal):
+            # Как pydantic-сериализация в основном пути презентера - без потери точности
+            return str
+        if issubclass(t, (bytes, bytearray)):
+            return lambda o: o.decode()
+        if issubclass(t, PurePath):
+            return str
+        if issubclass(t, datetime.timedelta):
+            return lambda o: o.total_seconds()
+        return self._object_encoder()
+
+    def _list_encoder(self, owner: str) -> Encoder:
+        enc = self.encode
+
+        def encode_list(o) -> list:
+            r = []
+            for v in o:
+                try:
+                    r.append(enc(v))
+                except Exception as ex:
+                    v = _degrade(owner, len(r), v, ex)
+                    if v is not _DROP:
+                        r.append(v)
+            return r
+
+        return encode_list
+
+    def _dict_encoder(self, default_owner: str = "dict") -> Encoder:
+        enc = self.encode
+        exclude_none = self.exclude_none
+        sqlalchemy_safe = self.sqlalchemy_safe
+
+        def encode_dict(o: dict, owner: str = default_owner) -> dict:
+            r = {}
+            for k, v in o.items():
+                if v is None and exclude_none:
+                    continue
+                try:
+                    if type(k) is not str:
+                        k = str(enc(k))
+                    elif sqlalchemy_safe and k.startswith("_sa"):
+                        continue
+                    r[k] = enc(v)
+                except Exception as ex:
+                    v = _degrade(owner, k, v, ex)
+                    if v is not _DROP:
+                        r[str(k)] = v
+            return r
+
+        return encode_dict
+
+    def _object_encoder(self) -> Encoder:
+        encode_dict = self._dict_encoder()
+
+        def encode_object(o: Any) -> Any:
+            if hasattr(o, "__dict__"):
+                return encode_dict(vars(o), type(o).__name__)
+            return str(o)
+
+        return encode_object
+
+    def _model_encoder(self, t: type) -> Encoder:
+        enc = self.encode
+        options = dict(by_alias=self.by_alias, exclude_none=self.exclude_none, exclude_unset=self.exclude_unset,
+                       exclude_defaults=self.exclude_defaults)
+        if hasattr(t, "model_dump"):
+            return lambda o: enc(o.model_dump(mode="json", **options))
+        return lambda o: enc(o.dict(**options))
+
+    def _dataclass_encoder(self, t: type) -> Encoder:
+        names = tuple(f.name for f in dataclasses.fields(t))
+        if not names:
+            return lambda o: {}
+        # Значения всех полей читаются одним вызовом attrgetter
+        getter = operator.attrgetter(*names) if len(names) > 1 else (lambda o, g=operator.attrgetter(names[0]): (g(o),))
+        enc = self.encode
+        passthrough = self._passthrough
+        encode_object = self._object_encoder()
+        exclude_none = self.exclude_none
+        owner = t.__name__
+
+        def encode_dataclass(o) -> Any:
+            d = getattr(o, "__dict__", None)
+            if d is not None and len(d) != len(names):
+                # Атрибуты, добавленные объекту вне полей (или незаданные поля) - кодируем как обычный объект
+                return encode_object(o)
+            r = {}
+            for name, v in zip(names, getter(o)):
+                if v is None and exclude_none:
+                    continue
+                try:
+                    r[name] = v if type(v) in passthrough else enc(v)
+                except Exception as ex:
+                    v = _degrade(owner, name, v, ex)
+                    if v is not _DROP:
+                        r[name] = v
+            return r
+
+        return encode_dataclass
+
+
+_registries: Dict[Any, EncoderRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(**options) -> EncoderRegistry:
+    """Общий реестр для набора опций: презентеры с одинаковыми настройками делят кэш кодировщиков"""
+    custom_encoder = options.get("custom_encoder")
+    try:
+        key = tuple(sorted((k, tuple(v.items()) if k == "custom_encoder" and v else v) for k, v in options.items()))
+        hash(key)
+    except TypeError:
+        return EncoderRegistry(**options)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = _registries[key] = EncoderRegistry(**dict(options, custom_encoder=custom_encoder))
+    return registry
+
+
+def to_jsonable(obj: Any, exclude_none: bool = True, by_alias: bool = True, exclude_unset: bool = False,
+                exclude_defaults: bool = False, custom_encoder: Optional[Dict[Any, Encoder]] = None,
+                include: Optional[IncEx] = None, exclude: Optional[IncEx] = None, sqlalchemy_safe: bool = False,
+                json_compatible: bool = False, degraded: Optional[List[str]] = None) -> Any:
+    """
+    Однопроходное приведение результата к структурам, которые orjson (или json при json_compatible=True)
+    сериализует напрямую.
+
+    Повторяет семантику jsonable_encoder для опций презентера (exclude_none, by_alias, include/exclude,
+    custom_encoder), но не строит промежуточных pydantic-моделей.
+
+    В degraded (если передан) дописываются поля, которые не удалось закодировать и пришлось заменить строкой
+    или пропустить.
+    """
+    registry = get_registry(exclude_none=exclude_none, by_alias=by_alias, exclude_unset=exclude_unset,
+                            exclude_defaults=exclude_defaults, custom_encoder=custom_encoder,
+                            sqlalchemy_safe=sqlalchemy_safe, json_compatible=json_compatible)
+    r = registry.encode_many((obj,), degraded)[0]
+    if include is not None or exclude is not None:
+        r = _filter_keys(r, include, exclude)
+    return r
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализация в JSON-байты через orjson"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def pack_msgpack(obj: Any) -> bytes:
+    """Сериализация в MessagePack (ожидает результат to_jsonable с json_compatible=True)"""
+    return msgpack.packb(obj, default=str)
+
+
+def pack_cbor(obj: Any) -> bytes:
+    """Сериализация в CBOR (ожидает результат to_jsonable с json_compatible=True)"""
+    return cbor2.dumps(obj, default=lambda encoder, v: encoder.encode(str(v)))
+
+
+def media_type_of(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def decode_body(content: bytes, content_type: Optional[str] = None) -> Any:
+    """Разбор тела ответа по Content-Type: MessagePack, CBOR, иначе JSON"""
+    media_type = media_type_of(content_type)
+    if media_type in MSGPACK_MEDIA_TYPES:
+        if msgpack is None:
+            raise ImportError("msgpack is required to decode " + media_type)
+        return msgpack.unpackb(content)
+    if media_type == CBOR_MEDIA_TYPE:
+        if cbor2 is None:
+            raise ImportError("cbor2 is required to decode " + media_type)
+        return cbor2.loads(content)
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
@@ -0,0 +1,159 @@
+import hashlib
+import mimetypes
+import os
+import stat
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    stat_result: os.stat_result
+    media_type: Optional[str]
+    etag: str
+    last_modified: str
+
+
+def _file_info(path: str) -> FileInfo:
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise IsADirectoryError(path)
+    # Тот же ETag, что строит FileResponse - валидаторы совпадают при любом способе отдачи файла
+    etag_base = str(st.st_mtime) + "-" + str(st.st_size)
+    return FileInfo(stat_result=st, media_type=mimetypes.guess_type(path)[0],
+                    etag=f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"',
+                    last_modified=formatdate(st.st_mtime, usegmt=True))
+
+
+class FileInfoCache:
+    """
+    Кэш stat, mime-типа и валидаторов (ETag/Last-Modified) по пути на ttl секунд.
+
+    Изменение файла становится видно не позже чем через ttl.
+    """
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: Dict[str, Tuple[float, FileInfo]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> FileInfo:
+        now = time.monotonic()
+        item = self._items.get(path)
+        if item is not None and item[0] > now:
+            return item[1]
+        info = _file_info(path)
+        with self._lock:
+            if len(self._items) >= self.max_entries:
+                self._items = {k: v for k, v in self._items.items() if v[0] > now}
+                if len(self._items) >= self.max_entries:
+                    self._items.clear()
+            self._items[path] = (now + self.ttl, info)
+        return info
+
+
+def is_not_modified(headers: Mapping[str, str], info: FileInfo) -> bool:
+    """Условный GET: If-None-Match (слабое сравнение) приоритетнее If-Modified-Since"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return info.etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(info.stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_single_range(headers: Mapping[str, str], info: FileInfo) -> Optional[Tuple[int, int]]:
+    """
+    Диапазон [start, end) из Range, если запрошен ровно один выполнимый диапазон байт и If-Range (если есть)
+    совпадает с текущей версией файла. Иначе None - отдается файл целиком (RFC 9110 это допускает).
+    """
+    http_range = headers.get("range")
+    if not http_range:
+        return None
+    if_range = headers.get("if-range")
+    if if_range is not None and if_range not in (info.etag, info.last_modified):
+        return None
+    units, _, spec = http_range.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition("-")
+    size = info.stat_result.st_size
+    try:
+        if not sep:
+            return None
+        if not start_s:
+            # Суффикс: последние N байт
+            length = int(end_s)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size
+        start = int(start_s)
+        end = min(int(end_s) + 1, size) if end_s else size
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        return None
+    return start, end
+
+
+class FileRangeResponse(FileResponse):
+    """
+    Отдача файла или одного диапазона байт. Если сервер поддерживает ASGI-расширение
+    http.response.zerocopysend, данные передаются sendfile'ом без копирования в процесс, иначе читаются
+    порциями в пуле потоков.
+    """
+
+    def __init__(self, path: str, info: FileInfo, start: int = 0, end: Optional[int] = None,
+                 filename: Optional[str] = None, headers: Optional[Mapping[str, str]] = None):
+        size = info.stat_result.st_size
+        self.start = start
+        self.end = size if end is None else end
+        partial = (self.start, self.end) != (0, size)
+        super().__init__(path, status_code=206 if partial else 200, headers=headers, media_type=info.media_type,
+                         filename=filename, stat_result=info.stat_result)
+        self.headers["content-length"] = str(self.end - self.start)
+        if partial:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end - 1}/{size}"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            f = await run_in_threadpool(open, self.path, "rb")
+            try:
+                if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                    await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": self.start,
+                                "count": self.end - self.start, "more_body": False})
+                else:
+                    await self._send_chunks(f, send)
+            finally:
+                await run_in_threadpool(f.close)
+        if self.background is not None:
+            await self.background()
+
+    async def _send_chunks(self, f, send):
+        await run_in_threadpool(f.seek, self.start)
+        remaining = self.end - self.start
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(self.chunk_size, remaining))
+            if not chunk:
+                raise RuntimeError(f"File at path {self.path} is shorter than expected.")
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
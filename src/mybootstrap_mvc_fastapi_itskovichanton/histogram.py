@@ -0,0 +1,218 @@
+import math
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+# Лог-линейные бакеты в стиле HDR Histogram: значения в микросекундах, первые 128 значений - точные,
+# далее каждый интервал [2^k, 2^(k+1)) делится на 64 бакета. Относительная погрешность не превышает ~1.6%.
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKET_COUNT = 1 << _SUB_BUCKET_BITS
+_SUB_BUCKET_HALF = _SUB_BUCKET_COUNT >> 1
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+DEFAULT_WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+
+# Фиксированные границы бакетов для экспорта гистограмм в Prometheus/OpenMetrics
+METRICS_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _bucket_index(v: int) -> int:
+    if v < _SUB_BUCKET_COUNT:
+        return v
+    shift = v.bit_length() - _SUB_BUCKET_BITS
+    return _SUB_BUCKET_COUNT + (shift - 1) * _SUB_BUCKET_HALF + ((v >> shift) - _SUB_BUCKET_HALF)
+
+
+def _bucket_value(idx: int) -> float:
+    """Середина диапазона значений бакета (в микросекундах)"""
+    if idx < _SUB_BUCKET_COUNT:
+        return float(idx)
+    shift = (idx - _SUB_BUCKET_COUNT) // _SUB_BUCKET_HALF + 1
+    sub = (idx - _SUB_BUCKET_COUNT) % _SUB_BUCKET_HALF + _SUB_BUCKET_HALF
+    return (sub << shift) + ((1 << shift) - 1) / 2
+
+
+def _percentile_key(q: float) -> str:
+    return f"p{q:g}"
+
+
+class LatencyHistogram:
+    """
+    Потоковая гистограмма задержек постоянного размера.
+
+    Запись - O(1) без сортировок и хранения значений, чтение перцентилей - один проход по бакетам.
+    Значения принимаются в миллисекундах, все что больше max_value_ms попадает в последний бакет.
+    """
+
+    def __init__(self, max_value_ms: float = 3_600_000):
+        self._max_value = int(max_value_ms * 1000)
+        self.counts = array('Q', bytes(8 * (_bucket_index(self._max_value) + 1)))
+        self.total = 0
+        self.sum_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms: Optional[float] = None
+
+    def record(self, value_ms: float, count: int = 1):
+        v = int(value_ms * 1000)
+        if v < 0:
+            v = 0
+        elif v > self._max_value:
+            v = self._max_value
+        self.counts[_bucket_index(v)] += count
+        self.total += count
+        self.sum_ms += value_ms * count
+        if self.min_ms is None or value_ms < self.min_ms:
+            self.min_ms = value_ms
+        if self.max_ms is None or value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def merge(self, other: 'LatencyHistogram'):
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.total += other.total
+        self.sum_ms += other.sum_ms
+        if other.min_ms is not None and (self.min_ms is None or other.min_ms < self.min_ms):
+            self.min_ms = other.min_ms
+        if other.max_ms is not None and (self.max_ms is None or other.max_ms > self.max_ms):
+            self.max_ms = other.max_ms
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * len(self.counts)))
+        self.total = 0
+        self.sum_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def percentiles(self, qs: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+        """Перцентили (в мс) за один проход по бакетам"""
+        qs = sorted(qs)
+        result = {_percentile_key(q): 0.0 for q in qs}
+        if not self.total:
+            return result
+
+        ranks = [(q, max(1, math.ceil(q / 100 * self.total))) for q in qs]
+        pos = 0
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            while pos < len(ranks) and seen >= ranks[pos][1]:
+                value = _bucket_value(idx) / 1000
+                # Уточняем крайние значения точными min/max
+                if self.min_ms is not None:
+                    value = max(value, self.min_ms)
+                if self.max_ms is not None:
+                    value = min(value, self.max_ms)
+                result[_percentile_key(ranks[pos][0])] = round(value, 3)
+                pos += 1
+            if pos == len(ranks):
+                break
+        return result
+
+    def value_range(self) -> Tuple[float, float]:
+        """Минимум и максимум (в мс): точные, если известны, иначе по крайним непустым бакетам"""
+        if not self.total:
+            return 0.0, 0.0
+        if self.min_ms is not None and self.max_ms is not None:
+            return self.min_ms, self.max_ms
+        counts = self.counts
+        lo = next(i for i, c in enumerate(counts) if c)
+        hi = next(i for i in range(len(counts) - 1, -1, -1) if counts[i])
+        return _bucket_value(lo) / 1000, _bucket_value(hi) / 1000
+
+    def summary(self, qs: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+        r = {
+            "count": self.total,
+            "avg": round(self.sum_ms / self.total, 3) if self.total else 0.0,
+            "min": round(self.min_ms, 3) if self.min_ms is not None else 0.0,
+            "max": round(self.max_ms, 3) if self.max_ms is not None else 0.0,
+        }
+        r.update(self.percentiles(qs))
+        return r
+
+
+class RollingLatencyHistogram:
+    """
+    Гистограммы задержек за скользящие окна (по умолчанию 1м/5м/15м).
+
+    Время делится на слоты по slot_seconds, в каждом слоте хранятся только непустые бакеты. Для каждого окна
+    поддерживается своя агрегированная гистограмма: запись добавляет значение во все окна, а вышедший
+    из окна слот вычитается из его агрегата. Запись - O(числа окон), чтение - один проход по бакетам.
+    """
+
+    def __init__(self, windows: Dict[str, int] = None, slot_seconds: int = 10, max_value_ms: float = 3_600_000):
+        self.slot_seconds = slot_seconds
+        self._max_value = int(max_value_ms * 1000)
+        # Размер окна в слотах
+        self._windows: Dict[str, int] = {name: max(1, math.ceil(seconds / slot_seconds))
+                                         for name, seconds in (windows or DEFAULT_WINDOWS).items()}
+        self._max_slots = max(self._windows.values())
+        self._aggregates: Dict[str, LatencyHistogram] = {name: LatencyHistogram(max_value_ms)
+                                                         for name in self._windows}
+        # Слоты: номер тика -> (бакет -> количество, сумма в мс)
+        self._slots: Dict[int, Tuple[Dict[int, int], list]] = {}
+        self._tick: Optional[int] = None
+
+    def _advance(self, now: float):
+        tick = int(now // self.slot_seconds)
+        if self._tick is None:
+            self._tick = tick
+            return
+        if tick <= self._tick:
+            return
+
+        if tick - self._tick >= self._max_slots:
+            # Простаивали дольше самого большого окна - все устарело
+            self._slots.clear()
+            for agg in self._aggregates.values():
+                agg.reset()
+        else:
+            for t in range(self._tick + 1, tick + 1):
+                for name, size in self._windows.items():
+                    expired = self._slots.get(t - size)
+                    if expired:
+                        self._subtract(self._aggregates[name], expired)
+                self._slots.pop(t - self._max_slots, None)
+        self._tick = tick
+
+    @staticmethod
+    def _subtract(agg: LatencyHistogram, slot: Tuple[Dict[int, int], list]):
+        counts, (total, sum_ms) = slot
+        for idx, c in counts.items():
+            agg.counts[idx] -= c
+        agg.total -= total
+        agg.sum_ms -= sum_ms
+
+    def record(self, value_ms: float, now: Optional[float] = None):
+        self._advance(time.time() if now is None else now)
+        slot = self._slots.get(self._tick)
+        if slot is None:
+            slot = self._slots[self._tick] = ({}, [0, 0.0])
+        v = min(max(int(value_ms * 1000), 0), self._max_value)
+        idx = _bucket_index(v)
+        counts, totals = slot
+        counts[idx] = counts.get(idx, 0) + 1
+        totals[0] += 1
+        totals[1] += value_ms
+        for agg in self._aggregates.values():
+            agg.counts[idx] += 1
+            agg.total += 1
+            agg.sum_ms += value_ms
+
+    def summary(self, qs: Iterable[float] = DEFAULT_PERCENTILES, now: Optional[float] = None) -> Dict[str, dict]:
+        self._advance(time.time() if now is None else now)
+        r = {}
+        for name, agg in self._aggregates.items():
+            s = {"count": agg.total, "avg": round(agg.sum_ms / agg.total, 3) if agg.total else 0.0}
+            s.update(agg.percentiles(qs))
+            r[name] = s
+        return r
+
+    def reset(self):
+        self._slots.clear()
+        self._tick = None
+        for agg in self._aggregates.values():
+            agg.reset()
@@ -0,0 +1,146 @@
+import asyncio
+import random
+from email.utils import parsedate_to_datetime
+from time import time
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+
+from src.mybootstrap_mvc_fastapi_itskovichanton import encoders
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import parse_response, aiter_response_items
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_RETRY_STATUSES = (502, 503, 504)
+# Повторяем только идемпотентные запросы: POST мог быть выполнен до обрыва соединения
+DEFAULT_RETRY_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncServiceClient:
+    """
+    Асинхронный клиент к другим сервисам: пул keep-alive соединений (httpx), ограничение одновременных
+    запросов на хост, таймауты и повторы с экспоненциальной задержкой и джиттером.
+
+    call() разбирает ответ через parse_response - с тем же маппингом ошибок (reason_mapping, CoreException,
+    ValidationException) и приведением результата к cl, что и для requests. transport позволяет подменить
+    сеть (например, httpx.ASGITransport или httpx.MockTransport в тестах).
+    """
+
+    def __init__(self, base_url: str = "", timeout: float = 10.0, connect_timeout: Optional[float] = None,
+                 max_connections: int = 100, max_connections_per_host: int = 20, keepalive_expiry: float = 30.0,
+                 retries: int = 2, backoff: float = 0.1, max_backoff: float = 2.0,
+                 retry_statuses: Sequence[int] = DEFAULT_RETRY_STATUSES,
+                 retry_methods: Sequence[str] = DEFAULT_RETRY_METHODS,
+                 reason_mapping: Dict[str, str] = None, headers: Dict[str, str] = None, transport=None):
+        if httpx is None:
+            raise ImportError("AsyncServiceClient requires httpx")
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_methods = frozenset(m.upper() for m in retry_methods)
+        self.reason_mapping = reason_mapping
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url, headers=headers, transport=transport,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout if connect_timeout is not None else timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=keepalive_expiry))
+
+    def _slots(self, url) -> asyncio.Semaphore:
+        host = url.netloc
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return slots
+
+    def _delay(self, attempt: int, response=None) -> float:
+        retry_after = _retry_after_seconds(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # Полный джиттер: повторы одновременно отказавших клиентов не приходят пачкой
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def request(self, method: str, url: str, **kwargs) -> 'httpx.Response':
+        """Запрос с повторами; тело ответа прочитано целиком"""
+        request = self._client.build_request(method, url, **kwargs)
+        async with self._slots(request.url):
+            return await self._send(request, stream=False)
+
+    async def _send(self, request: 'httpx.Request', stream: bool) -> 'httpx.Response':
+        retryable = request.method in self.retry_methods
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.send(request, stream=stream)
+            except httpx.TransportError:
+                if not retryable or attempt >= self.retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+            else:
+                if not retryable or attempt >= self.retries or response.status_code not in self.retry_statuses:
+                    return response
+                if stream:
+                    await response.aclose()
+                await asyncio.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    async def call(self, method: str, url: str, cl=None, reason_mapping: Dict[str, str] = None, **kwargs) -> Any:
+        """Запрос и разбор ответа через parse_response: результат (приведенный к cl) или исключение"""
+        response = await self.request(method, url, **kwargs)
+        return parse_response(response, reason_mapping if reason_mapping is not None else self.reason_mapping, cl)
+
+    async def stream_items(self, method: str, url: str, item_cl=None, reason_mapping: Dict[str, str] = None,
+                           **kwargs) -> AsyncIterator[Any]:
+        """
+        Элементы списка result из JSON-ответа по мере их прихода (приведенные к item_cl - типу элемента).
+        Повторы возможны только до начала чтения тела. Ответ с ошибкой или не-JSON разбирается целиком,
+        как в call().
+        """
+        reason_mapping = reason_mapping if reason_mapping is not None else self.reason_mapping
+        request = self._client.build_request(method, url, **kwargs)
+        async with self._slots(request.url):
+            response = await self._send(request, stream=True)
+            try:
+                media_type = encoders.media_type_of(response.headers.get("Content-Type"))
+                if response.is_success and media_type == encoders.JSON_MEDIA_TYPE:
+                    async for item in aiter_response_items(response.aiter_bytes(), item_cl, reason_mapping,
+                                                           response.status_code):
+                        yield item
+                    return
+                await response.aread()
+            finally:
+                await response.aclose()
+        result = parse_response(response, reason_mapping, list[item_cl] if item_cl else None)
+        for item in result or ():
+            yield item
+
+    async def get(self, url: str, cl=None, **kwargs) -> Any:
+        return await self.call("GET", url, cl=cl, **kwargs)
+
+    async def post(self, url: str, cl=None, **kwargs) -> Any:
+        return await self.call("POST", url, cl=cl, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self) -> 'AsyncServiceClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,51 @@
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Protocol
+
+
+class BodyLogPolicy(Protocol):
+    """Политика логирования тел запроса/ответа. Вызывается после ответа, для остальных пишутся только метаданные"""
+
+    def should_log_bodies(self, route: str, method: str, status_code: int, elapsed_ms: float) -> bool:
+        ...
+
+
+class AlwaysLogBodiesPolicy(BodyLogPolicy):
+    """Логировать тела всегда (поведение по умолчанию)"""
+
+    def should_log_bodies(self, route: str, method: str, status_code: int, elapsed_ms: float) -> bool:
+        return True
+
+
+@dataclass
+class SamplingBodyLogPolicy(BodyLogPolicy):
+    """
+    Выборочное логирование тел.
+
+    Тела логируются для всех 4xx/5xx (если включено), для всех запросов дольше slow_ms и для доли
+    success_sample_rate остальных. В routes можно переопределить политику для конкретного маршрута:
+    ключ - шаблон маршрута ("/search1/{table}") или метод + шаблон ("GET /search1/{table}").
+    """
+    success_sample_rate: float = 0.01
+    log_client_errors: bool = True
+    log_server_errors: bool = True
+    slow_ms: Optional[float] = None
+    routes: Dict[str, BodyLogPolicy] = field(default_factory=dict)
+
+    def should_log_bodies(self, route: str, method: str, status_code: int, elapsed_ms: float) -> bool:
+        if self.routes:
+            policy = self.routes.get(f"{method} {route}") or self.routes.get(route)
+            if policy is not None:
+                return policy.should_log_bodies(route, method, status_code, elapsed_ms)
+
+        if status_code >= 500:
+            if self.log_server_errors:
+                return True
+        elif status_code >= 400:
+            if self.log_client_errors:
+                return True
+
+        if self.slow_ms is not None and elapsed_ms >= self.slow_ms:
+            return True
+
+        return self.success_sample_rate > 0 and random.random() < self.success_sample_rate
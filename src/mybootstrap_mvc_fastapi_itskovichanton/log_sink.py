@@ -0,0 +1,275 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEW = "drop_new"
+OVERFLOW_BLOCK = "block"
+
+_OVERFLOW_POLICIES = {OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEW, OVERFLOW_BLOCK}
+
+# Запущенные и незакрытые приемники: при завершении процесса дописываем их очереди.
+# Обработчик atexit один на модуль, так что сами приемники он не удерживает
+_open_sinks: 'weakref.WeakSet[QueuedLogSink]' = weakref.WeakSet()
+
+
+class QueuedLogSink:
+    """
+    Неблокирующий приемник записей лога.
+
+    Записи складываются в ограниченную очередь в памяти, а форматирование и запись на диск выполняет
+    фоновый поток, забирающий записи пачками. Пачка пишется в потоковые и файловые обработчики одним write
+    и одним flush. Event loop при логировании не ждет диска.
+
+    Политика переполнения очереди:
+        drop_oldest - выбрасываем самую старую запись (по умолчанию);
+        drop_new - выбрасываем новую запись;
+        block - ждем освобождения места не дольше block_timeout. Из корутин пишем через aput: место ждем
+            асинхронно, не останавливая event loop.
+    """
+
+    def __init__(
+            self,
+            logger: logging.Logger,
+            max_queue_size: int = 10000,
+            batch_size: int = 256,
+            overflow_policy: str = OVERFLOW_DROP_OLDEST,
+            block_timeout: Optional[float] = 1.0,
+            level: int = logging.INFO
+    ):
+        if overflow_policy not in _OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy должен быть одним из {sorted(_OVERFLOW_POLICIES)}")
+        if overflow_policy == OVERFLOW_BLOCK and (block_timeout is None or block_timeout <= 0):
+            raise ValueError("для политики block нужен положительный block_timeout")
+        self.logger = logger
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.level = level
+
+        self._queue: Deque[Any] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # Корутины, ждущие места в очереди (политика block): (event loop, future)
+        self._space_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+        # Счетчики
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+        self._errors = 0
+
+    def put(self, record: Any) -> bool:
+        """
+        Постановка записи в очередь. Возвращает False, если запись была отброшена.
+        При политике block вызывающий поток ждет до block_timeout - из корутин используйте aput.
+        """
+        if self._closed or not self.logger.isEnabledFor(self.level):
+            return False
+        self._ensure_started()
+
+        with self._cond:
+            if len(self._queue) >= self.max_queue_size:
+                if self.overflow_policy == OVERFLOW_DROP_NEW:
+                    self._dropped += 1
+                    return False
+                if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._dropped += 1
+                elif not self._cond.wait_for(lambda: len(self._queue) < self.max_queue_size or self._closed,
+                                             timeout=self.block_timeout) or self._closed:
+                    self._dropped += 1
+                    return False
+
+            self._append(record)
+        return True
+
+    async def aput(self, record: Any) -> bool:
+        """Постановка записи в очередь из корутины: при политике block место ждем асинхронно"""
+        if self.overflow_policy != OVERFLOW_BLOCK:
+            return self.put(record)
+        if self._closed or not self.logger.isEnabledFor(self.level):
+            return False
+        self._ensure_started()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.block_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    self._dropped += 1
+                    return False
+                if len(self._queue) < self.max_queue_size:
+                    self._append(record)
+                    return True
+                future = loop.create_future()
+                self._space_waiters.append((loop, future))
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                with self._cond:
+                    self._dropped += 1
+                return False
+            finally:
+                with self._cond:
+                    try:
+                        self._space_waiters.remove((loop, future))
+                    except ValueError:
+                        pass
+
+    def _append(self, record: Any):
+        # Вызывается под self._cond
+        self._queue.append(record)
+        self._enqueued += 1
+        self._cond.notify_all()
+
+    def _wake_space_waiters(self):
+        # Вызывается под self._cond из фонового потока
+        for loop, future in self._space_waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Event loop уже закрыт
+                pass
+        self._space_waiters.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики приемника"""
+        return {
+            "queued": len(self._queue),
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "dropped": self._dropped,
+            "errors": self._errors,
+            "max_queue_size": self.max_queue_size
+        }
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Остановка фонового потока с дозаписью оставшихся записей"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            self._wake_space_waiters()
+        _open_sinks.discard(self)
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        # Поток запускаем лениво и перезапускаем после fork (воркеры gunicorn/uvicorn)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            _open_sinks.add(self)
+            self._thread = threading.Thread(target=self._run, name=f"log-sink-{self.logger.name}", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._closed)
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            # Будим тех, кто ждет места в очереди (политика block)
+            self._cond.notify_all()
+            if batch and self._space_waiters:
+                self._wake_space_waiters()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                # Очередь пуста и приемник закрыт
+                return
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: list):
+        """
+        Запись пачки: записи форматируются, а потоковые и файловые обработчики пишут всю пачку одним write и
+        одним flush под одной блокировкой. Остальные обработчики (ротация, сеть и т.п.) получают записи по одной
+        """
+        logger = self.logger
+        records = []
+        for msg in batch:
+            try:
+                record = logger.makeRecord(logger.name, self.level, __file__, 0, msg, None, None, "_write_batch")
+                if logger.filter(record):
+                    records.append(record)
+                self._written += 1
+            except Exception:
+                self._errors += 1
+        if not records or logger.disabled:
+            return
+
+        handlers = _handlers(logger)
+        if not handlers:
+            # Обработчиков нет - пусть logging сам решит (logging.lastResort)
+            for record in records:
+                logger.handle(record)
+            return
+        for handler in handlers:
+            if type(handler) in _BATCHED_HANDLERS and handler.stream is not None:
+                self._emit_batch(handler, records)
+            else:
+                for record in records:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+    def _emit_batch(self, handler: logging.StreamHandler, records: list):
+        handler.acquire()
+        try:
+            lines = [handler.format(r) + handler.terminator for r in records
+                     if r.levelno >= handler.level and handler.filter(r)]
+            if lines:
+                handler.stream.write("".join(lines))
+                handler.flush()
+        except Exception:
+            self._errors += len(records)
+        finally:
+            handler.release()
+
+
+# Обработчики, которые пишут пачку одним write: точные типы, у подклассов (ротация) своя логика emit
+_BATCHED_HANDLERS = (logging.StreamHandler, logging.FileHandler)
+
+
+def _handlers(logger: logging.Logger) -> List[logging.Handler]:
+    """Обработчики, которые получили бы запись logger (как в Logger.callHandlers)"""
+    handlers = []
+    while logger:
+        handlers.extend(logger.handlers)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return handlers
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def close_all_sinks(timeout: Optional[float] = 5.0):
+    """Остановка всех незакрытых приемников с дозаписью очередей"""
+    for sink in list(_open_sinks):
+        sink.close(timeout)
+
+
+atexit.register(close_all_sinks)
@@ -0,0 +1,134 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+MASK = "***MASKED***"
+
+# Значение JSON-поля: строка (в том числе оборванная усечением, даже посреди экранирования), число, true/false
+# или начало массива/объекта - его конец ищет _container_end
+_JSON_VALUE = r'"(?:[^"\\]|\\.)*(?:"|\\?$)|-?\d[\d.e+-]*|true|false|[\[{]'
+# То же внутри JSON, сериализованного строкой ({\"password\": \"...\"})
+_ESCAPED_JSON_VALUE = r'\\"(?:[^"\\]|\\[^"])*(?:\\"|\\?$)|-?\d[\d.e+-]*|true|false|[\[{]'
+_FORM_VALUE = r'[^&;#\s"]*'
+# Что может стоять перед именем параметра в form-urlencoded теле или query-строке
+_FORM_SEPARATORS = frozenset("?&; \t\r\n")
+
+
+def _container_end(text: str, start: int, escaped: bool) -> int:
+    """
+    Позиция за скобкой, закрывающей массив или объект, который начинается в text[start]. Скобки внутри строк
+    не считаются. escaped - JSON сериализован строкой: пары \\x читаются как x, а одиночная кавычка
+    закрывает внешнюю строку. Если текст оборван (усечением), массив/объект продолжается до его конца
+    """
+    depth = 0
+    in_string = False
+    backslash = False
+    i, n = start, len(text)
+    while i < n:
+        c = text[i]
+        i += 1
+        if escaped:
+            if c == '"':
+                return i - 1
+            if c == "\\" and i < n:
+                c = text[i]
+                i += 1
+        if in_string:
+            if backslash:
+                backslash = False
+            elif c == "\\":
+                backslash = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+            if not depth:
+                return i
+    return n
+
+
+class SensitiveDataMasker:
+    """
+    Маскировка значений чувствительных полей в тексте за один проход.
+
+    Для набора полей компилируется одно регулярное выражение, которое находит:
+    - поля JSON на любой глубине вложенности, в том числе JSON, сериализованный в строку. Значение-массив или
+      объект маскируется целиком, до парной скобки;
+    - пары field=value в form-urlencoded телах и query-строках (в том числе внутри URL).
+
+    Регистр не учитывается: поиск идет по тексту в нижнем регистре, так что выражение начинается с самих имен
+    полей и движок регулярных выражений быстро пропускает остальные позиции. Текст, в котором нет ни одного
+    имени поля, отсекается поиском подстрок, без регулярного выражения.
+    Имя поля сравнивается целиком: маскируется "password", но не "password_hint".
+    """
+
+    def __init__(self, fields: Iterable[str], mask: str = MASK):
+        self.fields = frozenset(f.lower() for f in fields if f)
+        self.mask = mask
+        self._pattern: Optional[re.Pattern] = None
+        self._ignorecase_pattern: Optional[re.Pattern] = None
+        if self.fields:
+            names = "|".join(re.escape(f) for f in sorted(self.fields, key=len, reverse=True))
+            pattern = rf'(?:{names})(?:"\s*:\s*(?P<json>{_JSON_VALUE})' \
+                      rf'|\\"\s*:\s*(?P<escaped>{_ESCAPED_JSON_VALUE})|=(?P<form>{_FORM_VALUE}))'
+            self._pattern = re.compile(pattern)
+            # Для текста, длина которого меняется при переводе в нижний регистр (редкие символы Unicode)
+            self._ignorecase_pattern = re.compile(pattern, re.IGNORECASE)
+        self._json_mask = f'"{mask}"'
+        self._escaped_mask = f'\\"{mask}\\"'
+
+    def __bool__(self) -> bool:
+        return self._pattern is not None
+
+    def mask_text(self, text: str) -> str:
+        """Текст (JSON, form-urlencoded, query-строка, URL) с замаскированными значениями"""
+        if self._pattern is None or not text:
+            return text
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = text
+            pattern = self._ignorecase_pattern
+        else:
+            if not any(f in lowered for f in self.fields):
+                return text
+            pattern = self._pattern
+
+        parts: List[str] = []
+        pos = 0
+        for m in pattern.finditer(lowered):
+            start = m.start()
+            if start < pos:
+                # Внутри уже замаскированного массива/объекта
+                continue
+            if m.group("json") is not None:
+                # Имя поля должно быть ключом целиком: "password", а не "old_password"
+                if start < 1 or lowered[start - 1] != '"' or (start > 1 and lowered[start - 2] == "\\"):
+                    continue
+                group, mask = "json", self._json_mask
+            elif m.group("escaped") is not None:
+                if lowered[start - 2:start] != '\\"':
+                    continue
+                group, mask = "escaped", self._escaped_mask
+            else:
+                if start and lowered[start - 1] not in _FORM_SEPARATORS:
+                    continue
+                group, mask = "form", self.mask
+            value_start, value_end = m.span(group)
+            if lowered[value_start] in "[{":
+                value_end = _container_end(lowered, value_start, group == "escaped")
+            parts.append(text[pos:value_start])
+            parts.append(mask)
+            pos = value_end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
+
+    def mask_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Разобранные параметры (например, query) с замаскированными значениями"""
+        if not self.fields:
+            return params
+        return {k: self.mask if k.lower() in self.fields else v for k, v in params.items()}
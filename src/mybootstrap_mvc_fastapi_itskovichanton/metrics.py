@@ -0,0 +1,124 @@
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from src.mybootstrap_ioc_itskovichanton.ioc import bean
+from src.mybootstrap_mvc_fastapi_itskovichanton.histogram import METRICS_LATENCY_BUCKETS_MS
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_stats import StatsHolder, StatisticsMiddleware, \
+    ROUTE_OVERFLOW
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape_label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _split_route_key(key: str) -> (str, str):
+    if key == ROUTE_OVERFLOW:
+        return "", key
+    method, _, route = key.partition(" ")
+    return method, route
+
+
+def render_openmetrics(middleware: StatisticsMiddleware, prefix: str = "http") -> str:
+    """
+    Метрики StatisticsMiddleware в текстовом формате OpenMetrics.
+
+    Строится только из предагрегированных счетчиков (по маршрутам и фиксированным бакетам), поэтому
+    стоимость не зависит от объема трафика - лишь от числа маршрутов.
+    """
+    bounds = [f"{b / 1000:g}" for b in METRICS_LATENCY_BUCKETS_MS] + ["+Inf"]
+    lines: List[str] = [
+        f"# TYPE {prefix}_requests counter",
+        f"# HELP {prefix}_requests Number of processed HTTP requests.",
+    ]
+    routes = sorted(middleware._routes.items())
+    labels = {}
+    for key, stats in routes:
+        method, route = _split_route_key(key)
+        labels[key] = f'method="{_escape_label(method)}",route="{_escape_label(route)}"'
+        for status, count in sorted(stats.statuses.items()):
+            lines.append(f'{prefix}_requests_total{{{labels[key]},status="{status}"}} {count}')
+
+    lines += [
+        f"# TYPE {prefix}_request_duration_seconds histogram",
+        f"# UNIT {prefix}_request_duration_seconds seconds",
+        f"# HELP {prefix}_request_duration_seconds HTTP request duration up to the last byte of the response.",
+    ]
+    for key, stats in routes:
+        cumulative = 0
+        for le, count in zip(bounds, stats.latency_buckets):
+            cumulative += count
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels[key]},le="{le}"}} {cumulative}')
+        lines.append(f'{prefix}_request_duration_seconds_count{{{labels[key]}}} {cumulative}')
+        lines.append(f'{prefix}_request_duration_seconds_sum{{{labels[key]}}} {stats.latency.sum_ms / 1000:.6f}')
+
+    if middleware.shared_stats:
+        lines += _render_cluster(middleware.shared_stats.aggregate(), bounds, prefix)
+
+    lines += [
+        f"# TYPE {prefix}_requests_in_flight gauge",
+        f"# HELP {prefix}_requests_in_flight Number of HTTP requests being processed.",
+        f"{prefix}_requests_in_flight {middleware._in_flight}",
+        f"# TYPE {prefix}_uptime_seconds gauge",
+        f"# UNIT {prefix}_uptime_seconds seconds",
+        f"# HELP {prefix}_uptime_seconds Time since statistics collection started.",
+        f"{prefix}_uptime_seconds {time.time() - middleware._start_time:.3f}",
+        "# EOF",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _render_cluster(cluster: dict, bounds: List[str], prefix: str) -> List[str]:
+    """Метрики, суммированные по всем воркерам (SharedStatsArea)"""
+    lines = [
+        f"# TYPE {prefix}_cluster_requests counter",
+        f"# HELP {prefix}_cluster_requests Number of processed HTTP requests across all workers.",
+    ]
+    for status, count in sorted(cluster["statuses"].items()):
+        lines.append(f'{prefix}_cluster_requests_total{{status="{status}"}} {count}')
+    lines += [
+        f"# TYPE {prefix}_cluster_request_duration_seconds histogram",
+        f"# UNIT {prefix}_cluster_request_duration_seconds seconds",
+        f"# HELP {prefix}_cluster_request_duration_seconds HTTP request duration across all workers.",
+    ]
+    cumulative = 0
+    for le, count in zip(bounds, cluster["latency_buckets"]):
+        cumulative += count
+        lines.append(f'{prefix}_cluster_request_duration_seconds_bucket{{le="{le}"}} {cumulative}')
+    lines += [
+        f"{prefix}_cluster_request_duration_seconds_count {cumulative}",
+        f"{prefix}_cluster_request_duration_seconds_sum {cluster['latency_sum_ms'] / 1000:.6f}",
+        f"# TYPE {prefix}_cluster_requests_in_flight gauge",
+        f"# HELP {prefix}_cluster_requests_in_flight Number of HTTP requests being processed across all workers.",
+        f"{prefix}_cluster_requests_in_flight {cluster['in_flight']}",
+        f"# TYPE {prefix}_cluster_workers gauge",
+        f"# HELP {prefix}_cluster_workers Number of live workers writing statistics.",
+        f"{prefix}_cluster_workers {cluster['workers']}",
+    ]
+    return lines
+
+
+@bean
+class MetricsFastAPISupport:
+    """Эндпоинт для Prometheus/OpenMetrics. Отрендеренный текст кэшируется между скрейпами на cache_ttl секунд"""
+    stats_holder: StatsHolder
+
+    def mount(self, fast_api: FastAPI, path: str = "/metrics", prefix: str = "http", cache_ttl: float = 1.0):
+        cached: Optional[bytes] = None
+        cached_at = 0.0
+
+        @fast_api.get(path, include_in_schema=False)
+        async def metrics():
+            nonlocal cached, cached_at
+            middleware = self.stats_holder.middleware
+            if middleware is None:
+                return Response(content="# EOF\n", media_type=OPENMETRICS_CONTENT_TYPE)
+
+            now = time.monotonic()
+            if cached is None or now - cached_at >= cache_ttl:
+                cached = render_openmetrics(middleware, prefix).encode("utf-8")
+                cached_at = now
+            return Response(content=cached, media_type=OPENMETRICS_CONTENT_TYPE)
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import ROUTE_UNMATCHED, _get_route_template
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+
+class ConcurrencyLimiter:
+    """
+    Ограничение числа одновременно выполняемых запросов с ограниченной очередью ожидания.
+
+    Освободившееся место передается первому ожидающему (FIFO). Если задана target_latency_ms, лимит
+    подстраивается по AIMD: окно со средней задержкой выше цели уменьшает лимит в backoff раз, окно без
+    превышения, в котором лимит был выбран полностью, увеличивает его на единицу (но не выше max_limit).
+    """
+
+    def __init__(self, limit: int, max_queue: int = 100, queue_timeout: float = 1.0,
+                 target_latency_ms: Optional[float] = None, min_limit: int = 1, max_limit: Optional[int] = None,
+                 backoff: float = 0.9, adapt_interval: float = 1.0):
+        self.limit = float(limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency_ms = target_latency_ms
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit
+        self.backoff = backoff
+        self.adapt_interval = adapt_interval
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # Окно для AIMD
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._window_sum_ms = 0.0
+        self._window_saturated = False
+
+    def _has_room(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> bool:
+        """True - запрос допущен (по завершении обязателен release), False - отклонен"""
+        if self._has_room() and not self._waiters:
+            self._admit()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Место передали одновременно с истечением таймаута
+                return True
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                pass
+
+    def _admit(self):
+        self.in_flight += 1
+        self.admitted += 1
+        if not self._has_room():
+            self._window_saturated = True
+
+    def release(self, elapsed_ms: Optional[float] = None):
+        self.in_flight -= 1
+        if elapsed_ms is not None and self.target_latency_ms is not None:
+            self._adapt(elapsed_ms)
+        while self._waiters and self._has_room():
+            future = self._waiters.popleft()
+            if not future.done():
+                self._admit()
+                future.set_result(True)
+
+    def _adapt(self, elapsed_ms: float):
+        self._window_count += 1
+        self._window_sum_ms += elapsed_ms
+        now = time.monotonic()
+        if now - self._window_start < self.adapt_interval:
+            return
+        if self._window_sum_ms / self._window_count > self.target_latency_ms:
+            self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        elif self._window_saturated:
+            self.limit = min(float(self.max_limit), self.limit + 1)
+        self._window_start = now
+        self._window_count = 0
+        self._window_sum_ms = 0.0
+        self._window_saturated = not self._has_room()
+
+    def summary(self) -> dict:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "queued": len(self._waiters),
+                "admitted": self.admitted, "rejected": self.rejected, "timed_out": self.timed_out}
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI-middleware контроля допуска: ограничивает число одновременно выполняемых запросов по маршрутам.
+
+    Сверх лимита запрос ждет в ограниченной очереди не дольше queue_timeout; при переполнении очереди или
+    по таймауту сразу отвечаем 503 с Retry-After, не нагружая event loop. Маршрут (шаблон пути с root_path,
+    например /search1/{table}, - тот же ключ, что в статистике и логах) определяется по роутеру приложения
+    до роутинга; лимиты отдельных маршрутов задаются в route_limits, остальным достается max_concurrency.
+    Запросы, не попавшие ни в один маршрут, не ограничиваются.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            max_concurrency: int = 100,
+            route_limits: Optional[Dict[str, int]] = None,
+            max_queue: int = 100,
+            queue_timeout: float = 1.0,
+            retry_after: int = 1,
+            target_latency_ms: Optional[float] = None,
+            min_limit: int = 1,
+            excluded_paths: Optional[set] = None,
+            max_cached_paths: int = 10000,
+    ):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.route_limits = route_limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.target_latency_ms = target_latency_ms
+        self.min_limit = min_limit
+        self.excluded_paths = excluded_paths or {'/healthcheck', '/metrics', '/stats'}
+        self.max_cached_paths = max_cached_paths
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+        self._route_cache: Dict[Tuple[str, str, str], Optional[str]] = {}
+        self._rejection = JSONResponse(
+            {"error": {"message": "Сервер перегружен, повторите запрос позже"}}, status_code=503,
+            headers={"Retry-After": str(retry_after)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve_route(scope)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self._get_limiter(route)
+        if not await limiter.acquire():
+            await self._rejection(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release((time.perf_counter() - start_time) * 1000)
+
+    def _resolve_route(self, scope: Scope) -> Optional[str]:
+        """Шаблон маршрута, которому достанется запрос (результат кэшируется по методу и пути)"""
+        key = (scope["method"], scope.get("root_path", ""), scope["path"])
+        try:
+            return self._route_cache[key]
+        except KeyError:
+            pass
+        route = None
+        router = getattr(scope.get("app"), "router", None)
+        for r in getattr(router, "routes", ()):
+            match, _ = r.matches(scope)
+            if match == Match.FULL:
+                route = r
+                break
+            if match == Match.PARTIAL and route is None:
+                route = r
+        if route is not None:
+            # Ключ строится так же, как ключи статистики и логов, - по сработавшему маршруту
+            route = _get_route_template({"route": route, "root_path": scope.get("root_path", "")})
+            if route == ROUTE_UNMATCHED:
+                route = None
+        if len(self._route_cache) >= self.max_cached_paths:
+            self._route_cache.clear()
+        self._route_cache[key] = route
+        return route
+
+    def _get_limiter(self, route: str) -> ConcurrencyLimiter:
+        limiter = self._limiters.get(route)
+        if limiter is None:
+            limiter = self._limiters[route] = ConcurrencyLimiter(
+                self.route_limits.get(route, self.max_concurrency), max_queue=self.max_queue,
+                queue_timeout=self.queue_timeout, target_latency_ms=self.target_latency_ms, min_limit=self.min_limit)
+        return limiter
+
+    def stats(self) -> Dict[str, dict]:
+        return {route: limiter.summary() for route, limiter in self._limiters.items()}
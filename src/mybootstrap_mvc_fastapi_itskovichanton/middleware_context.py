@@ -0,0 +1,27 @@
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import _current_request
+from starlette.requests import Request
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+
+class RequestContextMiddleware:
+    """
+    Чистый ASGI middleware: делает запрос доступным через utils.current_request() на время его обработки -
+    для презентеров, которые получают только Result (выбор формата, сжатие, условные запросы к файлам).
+
+    Запрос выставляется для каждого HTTP-запроса, независимо от того, строит ли контроллер Call через
+    get_call_from_request, и сбрасывается после отправки ответа. Подключать первым (самым внешним), чтобы
+    запрос видели и остальные middleware.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_request.set(Request(scope, receive))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
@@ -1,12 +1,15 @@
 import logging
-import re
 import time
 from datetime import datetime, timezone
 from typing import Optional, Union, Callable
 
 from fastapi import Request, Response
-from src.mybootstrap_mvc_fastapi_itskovichanton.utils import _read_response_body, _sanitize_headers, \
-    _parse_query_params, _read_request_body, _get_client_ip
+from src.mybootstrap_mvc_fastapi_itskovichanton.log_policy import BodyLogPolicy, AlwaysLogBodiesPolicy
+from src.mybootstrap_mvc_fastapi_itskovichanton.log_sink import QueuedLogSink, OVERFLOW_DROP_OLDEST
+from src.mybootstrap_mvc_fastapi_itskovichanton.masking import SensitiveDataMasker
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import _sanitize_headers, _parse_query_params, \
+    _read_request_body, _render_request_body, _get_client_ip, _get_route_template, _BodyTee, _tee_body_iterator, \
+    _decode_response_body
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 
@@ -24,14 +27,23 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
             log_response_body: bool = True,
             sensitive_fields: Optional[set] = None,
             excluded_paths: Optional[set] = None,
-            on_request=None
+            on_request=None,
+            log_sink: Optional[QueuedLogSink] = None,
+            log_queue_size: int = 10000,
+            log_overflow_policy: str = OVERFLOW_DROP_OLDEST,
+            body_log_policy: Optional[BodyLogPolicy] = None
     ):
         super().__init__(app)
         self.logger = logger
+        # Запись в лог (форматирование и I/O) выполняется в фоновом потоке, а не на event loop
+        self.log_sink = log_sink or QueuedLogSink(logger, max_queue_size=log_queue_size,
+                                                  overflow_policy=log_overflow_policy)
         self.on_request = on_request
         self.max_field_len = max_field_len
         self.log_request_body = log_request_body
         self.log_response_body = log_response_body
+        # Решает по маршруту, статусу и времени ответа, логировать ли тела или только метаданные
+        self.body_log_policy = body_log_policy or AlwaysLogBodiesPolicy()
         self.sensitive_fields = sensitive_fields or {
             # 'password', 'token', 'secret', 'authorization',
             # 'apikey', 'api_key', 'access_token', 'refresh_token'
@@ -40,11 +52,8 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
                                                  # '/health', '/metrics', '/docs', '/openapi.json'
                                                  }
 
-        # Компилируем паттерны для быстрой проверки
-        self._sensitive_patterns = [
-            re.compile(rf'\b{field}\b', re.IGNORECASE)
-            for field in self.sensitive_fields
-        ]
+        # Одно выражение на весь набор полей: маскирует JSON, form-тела и query-строки за один проход
+        self._masker = SensitiveDataMasker(self.sensitive_fields)
 
     async def dispatch(self, request: Request, call_next: Callable):
         # Пропускаем excluded пути
@@ -56,9 +65,8 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
         client_ip = _get_client_ip(request)
         client_port = request.client.port if request.client else None
 
-        # Читаем тело запроса (если нужно)
-        request_body = await _read_request_body(request, self.sensitive_fields,
-                                                self.max_field_len) if self.log_request_body else None
+        # Читаем сырое тело запроса (если нужно). Разбор и маскировка - только если политика решит его логировать
+        request_body = await _read_request_body(request) if self.log_request_body else None
 
         # Засекаем время выполнения
         start_time = time.perf_counter()
@@ -69,20 +77,35 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
         # Вычисляем время выполнения
         elapsed_ms = (time.perf_counter() - start_time) * 1000
 
-        # Читаем тело ответа (если нужно)
-        response_body = await _read_response_body(response) if self.log_response_body else None
+        async def _log(tee: Optional[_BodyTee] = None):
+            log_bodies = self.body_log_policy.should_log_bodies(
+                _get_route_template(request.scope), request.method, response.status_code, elapsed_ms)
+
+            # Формируем и логируем структурированный JSON
+            await self._log_request_response(
+                request=request,
+                response=response,
+                client_ip=client_ip,
+                client_port=client_port,
+                request_body=_render_request_body(request_body, self._masker, self.max_field_len)
+                if log_bodies else None,
+                response_body=_decode_response_body(tee, response.headers.get('content-type'), self._masker)
+                if log_bodies and tee else None,
+                elapsed_ms=elapsed_ms
+            )
+
+        if not self.log_response_body:
+            await _log()
+            return response
 
-        # Формируем и логируем структурированный JSON
-        await self._log_request_response(
-            request=request,
-            response=response,
-            client_ip=client_ip,
-            client_port=client_port,
-            request_body=request_body,
-            response_body=response_body,
-            elapsed_ms=elapsed_ms
-        )
+        # Тело ответа не буферизуем: чанки уходят клиенту как есть, а в лог попадает только начало тела.
+        # Логируем после отправки последнего чанка.
+        tee = _BodyTee(self.max_field_len)
 
+        async def _on_complete():
+            await _log(tee)
+
+        response.body_iterator = _tee_body_iterator(response.body_iterator, tee, _on_complete)
         return response
 
     async def _log_request_response(
@@ -100,7 +123,7 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
             "t": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
             "request": {
                 "request_headers": _sanitize_headers(dict(request.headers), self.sensitive_fields),
-                "params": _parse_query_params(request),
+                "params": self._masker.mask_params(_parse_query_params(request)),
                 "request-body": request_body,
                 "from": {
                     "ip": client_ip,
@@ -108,7 +131,7 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
                 }
             },
             "method": request.method,
-            "url": str(request.url),
+            "url": self._masker.mask_text(str(request.url)),
             "response": {
                 "response_headers": _sanitize_headers(dict(response.headers), self.sensitive_fields),
                 "body": response_body,
@@ -120,7 +143,7 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
         if self.on_request:
             await self.on_request(log_data)
 
-        self.logger.info(log_data)
+        await self.log_sink.aput(log_data)
 
     @classmethod
     def configure(
@@ -130,7 +153,10 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
             log_request_body: bool = True,
             log_response_body: bool = True,
             sensitive_fields: Optional[set] = None,
-            excluded_paths: Optional[set] = None
+            excluded_paths: Optional[set] = None,
+            log_queue_size: int = 10000,
+            log_overflow_policy: str = OVERFLOW_DROP_OLDEST,
+            body_log_policy: Optional[BodyLogPolicy] = None
     ):
         """Фабричный метод для удобной конфигурации"""
 
@@ -152,7 +178,10 @@ class HTTPLoggingMiddleware(BaseHTTPMiddleware):
                 log_request_body=log_request_body,
                 log_response_body=log_response_body,
                 sensitive_fields=sensitive_fields,
-                excluded_paths=excluded_paths
+                excluded_paths=excluded_paths,
+                log_queue_size=log_queue_size,
+                log_overflow_policy=log_overflow_policy,
+                body_log_policy=body_log_policy
             )
 
         return _middleware_factory
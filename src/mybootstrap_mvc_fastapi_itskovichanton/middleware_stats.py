@@ -1,22 +1,30 @@
-import statistics
+import bisect
+import heapq
+import itertools
 import time
+from array import array
 from collections import deque, defaultdict
 from dataclasses import dataclass, asdict, field
-from datetime import datetime, timedelta
-from functools import lru_cache
+from datetime import datetime
 from typing import List, Optional, Tuple, Deque, Dict, Any
 
-from fastapi import Request, Response
-from src.mybootstrap_core_itskovichanton.utils import hashed, to_dict_deep
+from src.mybootstrap_core_itskovichanton.utils import to_dict_deep
 from src.mybootstrap_ioc_itskovichanton.ioc import bean
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from src.mybootstrap_mvc_fastapi_itskovichanton.histogram import LatencyHistogram, RollingLatencyHistogram, \
+    METRICS_LATENCY_BUCKETS_MS, DEFAULT_WINDOWS, _bucket_index
+from src.mybootstrap_mvc_fastapi_itskovichanton.shared_stats import SharedStatsArea
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import _get_route_template
+from starlette.datastructures import URL
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+ROUTE_OVERFLOW = "<other>"
 
 
 @dataclass
 class UrlStatsRecord:
     url: str
     time: str
+    route: Optional[str] = None
 
 
 @dataclass
@@ -25,9 +33,9 @@ class UrlStats:
     response: str = None
     last_urls: Deque[UrlStatsRecord] = field(default_factory=lambda: deque(maxlen=10))
 
-    def inc(self, url):
+    def inc(self, url, route: Optional[str] = None):
         self.count += 1
-        self.last_urls.append(UrlStatsRecord(url=str(url), time=str(datetime.now())))
+        self.last_urls.append(UrlStatsRecord(url=str(url), time=str(datetime.now()), route=route))
 
     def summary(self) -> dict:
         return {"count": self.count, "last_urls": list(self.last_urls)}
@@ -38,17 +46,32 @@ class StatsHolder:
 
     def init(self, **kwargs):
         self._stats = {}
+        self._stats_time = 0.0
+        # Сводка строится при чтении (get), не чаще раза в snapshot_ttl секунд - не на пути запроса
+        self.snapshot_ttl = 5.0
         self._statuses = defaultdict(UrlStats)
+        self._middleware = None
+
+    def attach(self, middleware: 'StatisticsMiddleware'):
+        """Привязка middleware, чьи предагрегированные счетчики отдаются как метрики"""
+        self._middleware = middleware
+
+    @property
+    def middleware(self) -> Optional['StatisticsMiddleware']:
+        return self._middleware
 
     def update(self, stats):
         self._stats = stats
+        self._stats_time = time.monotonic()
 
     def get(self):
+        middleware = self._middleware
+        if middleware is not None and (not self._stats or time.monotonic() - self._stats_time >= self.snapshot_ttl):
+            self.update(middleware.get_extended_stats())
         return to_dict_deep({"time": self._stats,
                              "responses": {k: v.summary() for k, v in self._statuses.items()}})
 
 
-@hashed
 @dataclass
 class RequestRecord:
     """Запись о выполненном запросе"""
@@ -59,6 +82,8 @@ class RequestRecord:
     content_length: Optional[int] = None
     status_code: int = 0
     timestamp: datetime = field(default_factory=datetime.utcnow)
+    ttfb_ms: Optional[float] = None
+    route: Optional[str] = None
 
     def __lt__(self, other: 'RequestRecord') -> bool:
         """Для сравнения по времени выполнения (для сортировки)"""
@@ -68,6 +93,274 @@ class RequestRecord:
         return self.elapsed_ms > other.elapsed_ms
 
 
+class SlowestRequests:
+    """
+    Top-K самых долгих запросов, поддерживаемый при вставке (min-heap размера K).
+
+    Чтобы давние выбросы не висели в выдаче вечно, куча живет поколениями по period_seconds:
+    выдача строится по текущему и предыдущему поколению. Вставка - O(log K), чтение - O(K log K).
+    """
+
+    def __init__(self, k: int = 5, period_seconds: float = 300):
+        self.k = k
+        self.period_seconds = period_seconds
+        self._current: List[Tuple[float, int, RequestRecord]] = []
+        self._previous: List[Tuple[float, int, RequestRecord]] = []
+        self._period_start = time.monotonic()
+        self._seq = itertools.count()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._period_start >= self.period_seconds:
+            # Если простаивали дольше двух поколений - предыдущее тоже устарело
+            self._previous = self._current if now - self._period_start < 2 * self.period_seconds else []
+            self._current = []
+            self._period_start = now
+
+    def accepts(self, elapsed_ms: float) -> bool:
+        """Попадет ли запрос с таким временем в top-K (проверка до создания записи)"""
+        self._rotate()
+        return len(self._current) < self.k or elapsed_ms > self._current[0][0]
+
+    def push(self, record: RequestRecord):
+        self._rotate()
+        item = (record.elapsed_ms, next(self._seq), record)
+        if len(self._current) < self.k:
+            heapq.heappush(self._current, item)
+        elif record.elapsed_ms > self._current[0][0]:
+            heapq.heapreplace(self._current, item)
+
+    def top(self) -> List[RequestRecord]:
+        """Самые долгие запросы, по убыванию времени выполнения"""
+        self._rotate()
+        return [item[2] for item in heapq.nlargest(self.k, itertools.chain(self._current, self._previous))]
+
+    def clear(self):
+        self._current = []
+        self._previous = []
+        self._period_start = time.monotonic()
+
+
+class RequestRing:
+    """
+    Окно последних запросов: предвыделенный кольцевой буфер из параллельных колонок (array).
+
+    Запись не создает объектов. Агрегаты окна поддерживаются при записи (значения, вытесненные из окна,
+    вычитаются): задержки копятся в гистограмме, так что перцентили, минимум и максимум читаются одним
+    проходом по бакетам, а счетчики статусов и маршрутов, суммы ttfb и размеров ответов - сразу. Сортировок
+    и проходов по окну нет, NumPy не нужен - окна в 100k+ записей обходятся так же дешево.
+    """
+
+    def __init__(self, capacity: int, max_value_ms: float = 3_600_000):
+        self.capacity = capacity
+        self.elapsed_ms = array('d', bytes(8 * capacity))
+        self.ttfb_ms = array('d', bytes(8 * capacity))  # NaN - ответ не начался
+        self.timestamp = array('d', bytes(8 * capacity))
+        self.status = array('H', bytes(2 * capacity))
+        self.route_id = array('i', bytes(4 * capacity))
+        self.content_length = array('q', bytes(8 * capacity))  # -1 - неизвестна
+        self._max_value = int(max_value_ms * 1000)
+        self._latency = LatencyHistogram(max_value_ms)
+        self._pos = 0
+        self._len = 0
+        self._reset_aggregates()
+
+    def _reset_aggregates(self):
+        self._status_classes = [0] * 6  # 1xx..5xx, прочие - в [0]
+        self._route_counts: Dict[int, int] = defaultdict(int)
+        self._ttfb_sum = 0.0
+        self._ttfb_count = 0
+        self._length_sum = 0
+        self._length_count = 0
+
+    def __len__(self):
+        return self._len
+
+    def _bucket(self, elapsed_ms: float) -> int:
+        return _bucket_index(min(max(int(elapsed_ms * 1000), 0), self._max_value))
+
+    def _account(self, i: int, sign: int):
+        """Добавление (sign=1) или вычитание (sign=-1) строки i в агрегатах окна"""
+        elapsed_ms = self.elapsed_ms[i]
+        latency = self._latency
+        latency.counts[self._bucket(elapsed_ms)] += sign
+        latency.total += sign
+        latency.sum_ms += sign * elapsed_ms
+        status_class = self.status[i] // 100
+        self._status_classes[status_class if status_class < 6 else 0] += sign
+        self._route_counts[self.route_id[i]] += sign
+        ttfb_ms = self.ttfb_ms[i]
+        if ttfb_ms == ttfb_ms:
+            self._ttfb_sum += sign * ttfb_ms
+            self._ttfb_count += sign
+        content_length = self.content_length[i]
+        if content_length >= 0:
+            self._length_sum += sign * content_length
+            self._length_count += sign
+
+    def append(self, elapsed_ms: float, ttfb_ms: Optional[float], timestamp: float, status_code: int,
+               route_id: int, content_length: Optional[int]):
+        i = self._pos
+        if self._len == self.capacity:
+            self._account(i, -1)
+        else:
+            self._len += 1
+        self.elapsed_ms[i] = elapsed_ms
+        self.ttfb_ms[i] = float("nan") if ttfb_ms is None else ttfb_ms
+        self.timestamp[i] = timestamp
+        self.status[i] = min(max(status_code, 0), 0xFFFF)
+        self.route_id[i] = route_id
+        self.content_length[i] = -1 if content_length is None else content_length
+        self._account(i, 1)
+        self._pos = (i + 1) % self.capacity
+
+    def elapsed_aggregates(self) -> Tuple[float, float, float]:
+        """Среднее, минимум и максимум времени выполнения по окну (минимум и максимум - с точностью бакета)"""
+        if not self._len:
+            return 0.0, 0.0, 0.0
+        min_ms, max_ms = self._latency.value_range()
+        return self._latency.sum_ms / self._len, min_ms, max_ms
+
+    def elapsed_percentiles(self, qs=(50, 90, 99)) -> Dict[str, float]:
+        """Перцентили времени выполнения по окну"""
+        if not self._len:
+            return {}
+        return {k: round(v, 2) for k, v in self._latency.percentiles(qs).items()}
+
+    def column_summary(self, route_keys: List[str], top_routes: int = 10) -> Dict[str, Any]:
+        """Статусы, самые частые маршруты, средние ttfb и размер ответа, охват окна по времени и его RPS"""
+        if not self._len:
+            return {}
+        newest = self.timestamp[self._pos - 1]
+        oldest = self.timestamp[self._pos if self._len == self.capacity else 0]
+        span = newest - oldest
+        routes = heapq.nlargest(top_routes, ((c, i) for i, c in self._route_counts.items() if c))
+        return {
+            "statuses": {f"{j}xx": c for j, c in enumerate(self._status_classes) if j and c},
+            "top_routes": {route_keys[i] if 0 <= i < len(route_keys) else ROUTE_OVERFLOW: c for c, i in routes},
+            "avg_ttfb_ms": round(self._ttfb_sum / self._ttfb_count, 2) if self._ttfb_count else None,
+            "avg_content_length": round(self._length_sum / self._length_count, 1) if self._length_count else None,
+            "span_seconds": round(span, 3),
+            "requests_per_second": round(self._len / span, 3) if span > 0 else None
+        }
+
+    def clear(self):
+        self._pos = 0
+        self._len = 0
+        self._latency.reset()
+        self._reset_aggregates()
+
+
+class RequestRateWindows:
+    """
+    Посекундные счетчики запросов в кольцевом буфере: RPS, доля ошибок и задержка за скользящие окна.
+
+    Запись - O(1), чтение - один проход по секундам самого большого окна.
+    """
+
+    def __init__(self, windows: Dict[str, int] = None):
+        self._windows = sorted((windows or DEFAULT_WINDOWS).items(), key=lambda w: w[1])
+        self._size = self._windows[-1][1]
+        self._stamps = array('q', [-1]) * self._size
+        self._count = array('Q', [0]) * self._size
+        self._success = array('Q', [0]) * self._size
+        self._server_errors = array('Q', [0]) * self._size
+        self._sum_ms = array('d', [0.0]) * self._size
+        self._max_ms = array('d', [0.0]) * self._size
+
+    def record(self, status_code: int, elapsed_ms: float, now: Optional[float] = None):
+        second = int(time.time() if now is None else now)
+        i = second % self._size
+        if self._stamps[i] != second:
+            # Слот остался от прошлого круга - обнуляем
+            self._stamps[i] = second
+            self._count[i] = 0
+            self._success[i] = 0
+            self._server_errors[i] = 0
+            self._sum_ms[i] = 0.0
+            self._max_ms[i] = 0.0
+        self._count[i] += 1
+        if 200 <= status_code < 300:
+            self._success[i] += 1
+        elif status_code >= 500:
+            self._server_errors[i] += 1
+        self._sum_ms[i] += elapsed_ms
+        if elapsed_ms > self._max_ms[i]:
+            self._max_ms[i] = elapsed_ms
+
+    def summary(self, started_at: float, now: Optional[float] = None) -> Dict[str, dict]:
+        now = time.time() if now is None else now
+        second = int(now)
+        result = {}
+        count = success = server_errors = 0
+        sum_ms = max_ms = 0.0
+        age = 0
+        for name, seconds in self._windows:
+            # Окна вложены друг в друга - дочитываем только недостающие секунды
+            while age < seconds:
+                s = second - age
+                i = s % self._size
+                if self._stamps[i] == s:
+                    count += self._count[i]
+                    success += self._success[i]
+                    server_errors += self._server_errors[i]
+                    sum_ms += self._sum_ms[i]
+                    max_ms = max(max_ms, self._max_ms[i])
+                age += 1
+
+            # Пока процесс живет меньше окна, делим на фактическое время
+            duration = max(min(seconds, now - started_at), 1e-3)
+            result[name] = {
+                "requests": count,
+                "requests_per_second": round(count / duration, 3),
+                "success_rate_percent": round(success / count * 100, 2) if count else 0,
+                "failed_requests": count - success,
+                "server_error_rate_percent": round(server_errors / count * 100, 2) if count else 0,
+                "avg_response_time_ms": round(sum_ms / count, 2) if count else 0.0,
+                "max_response_time_ms": round(max_ms, 2)
+            }
+        return result
+
+    def reset(self):
+        for i in range(self._size):
+            self._stamps[i] = -1
+
+
+def _long_request_view(record: RequestRecord) -> Dict[str, Any]:
+    return {
+        "url": record.url,
+        "elapsed": round(record.elapsed_ms, 2),
+        "ttfb": round(record.ttfb_ms, 2) if record.ttfb_ms is not None else None,
+        "content_type": record.content_type,
+        "content_length": record.content_length,
+        "method": record.method,
+        "status_code": record.status_code,
+        "route": record.route
+    }
+
+
+@dataclass
+class RouteStats:
+    """Статистика по маршруту (метод + шаблон маршрута)"""
+    route_id: int = 0
+    count: int = 0
+    statuses: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    slowest: SlowestRequests = field(default_factory=SlowestRequests)
+    # Счетчики по бакетам METRICS_LATENCY_BUCKETS_MS (последний - +Inf), не накопительные
+    latency_buckets: List[int] = field(default_factory=lambda: [0] * (len(METRICS_LATENCY_BUCKETS_MS) + 1))
+
+    def record(self, status_code: int, elapsed_ms: float):
+        self.count += 1
+        self.statuses[f"{status_code // 100}xx"] += 1
+        self.latency.record(elapsed_ms)
+        self.latency_buckets[bisect.bisect_left(METRICS_LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def summary(self) -> dict:
+        return {"count": self.count, "statuses": dict(self.statuses), "latency": self.latency.summary(),
+                "most_long_requests": [_long_request_view(r) for r in self.slowest.top()]}
+
+
 @dataclass
 class LongRequest:
     """Долгий запрос для вывода в статистике"""
@@ -99,13 +392,19 @@ class AggregatedStats:
     min_response_time: float
     total_requests: int
     most_long_requests: List[Dict[str, Any]]
+    percentiles: Dict[str, float] = field(default_factory=dict)
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
 
 
-class StatisticsMiddleware(BaseHTTPMiddleware):
-    """Middleware для сбора статистики по HTTP запросам"""
+class StatisticsMiddleware:
+    """
+    ASGI-middleware для сбора статистики по HTTP запросам.
+
+    Работает поверх сырого ASGI (без BaseHTTPMiddleware): оборачивает send и фиксирует статус, заголовки,
+    время до первого байта (ttfb) и до последнего байта ответа. Стриминговые ответы проходят без буферизации.
+    """
 
     def __init__(
             self,
@@ -113,20 +412,20 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
             max_records: int = 500,
             excluded_paths: Optional[set] = None,
             stats_holder: StatsHolder = None,
+            max_routes: int = 200,
+            shared_stats: Optional[SharedStatsArea] = None,
     ):
-        super().__init__(app)
+        self.app = app
         self.max_records = max_records
         self.stats_holder = stats_holder
-        self._last_stats_set_time = None
+        if stats_holder is not None:
+            stats_holder.attach(self)
 
-        # Используем deque для ограниченного хранения записей
-        self._records: Deque[RequestRecord] = deque(maxlen=max_records)
-        self._lock = None  # В async context будем использовать asyncio.Lock
+        # Окно последних запросов в колоночном кольцевом буфере
+        self._records = RequestRing(max_records)
 
-        # Кэш для статистики
-        self._stats_cache: Optional[AggregatedStats] = None
-        self._cache_timestamp: float = 0
-        self._cache_ttl: float = 1.0  # Кэшируем на 1 секунду
+        # Самые долгие запросы (глобально; по маршрутам - в RouteStats)
+        self._slowest = SlowestRequests()
 
         # Исключенные пути
         self.excluded_paths = excluded_paths or {
@@ -138,36 +437,82 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
         self._total_counter: int = 0
         self._success_counter: int = 0
         self._start_time: float = time.time()
+        self._in_flight: int = 0
 
-    async def dispatch(self, request: Request, call_next):
-        # Пропускаем исключенные пути
-        path = request.url.path
-        if path in self.excluded_paths:
-            return await call_next(request)
-
-        # Засекаем время
-        start_time = time.perf_counter()
-
-        # Выполняем запрос
-        response = await call_next(request)
+        # Статистика по маршрутам. Число ключей ограничено max_routes, остальное копится в ROUTE_OVERFLOW
+        self.max_routes = max_routes
+        self._routes: Dict[str, RouteStats] = {}
+        # Ключи маршрутов по route_id (колонка route_id окна)
+        self._route_keys: List[str] = []
 
-        # Вычисляем время выполнения
-        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        # Общая для всех воркеров область счетчиков (при запуске в несколько процессов)
+        self.shared_stats = shared_stats
 
-        # Собираем информацию о запросе
-        await self._record_request(request, response, elapsed_ms)
+        # Потоковые гистограммы задержек: за все время и за скользящие окна 1м/5м/15м
+        self._latency = LatencyHistogram()
+        self._rolling_latency = RollingLatencyHistogram()
 
-        # Инвалидируем кэш статистики
-        self._invalidate_cache()
+        # RPS и доля ошибок за скользящие окна 1м/5м/15м
+        self._rate_windows = RequestRateWindows()
 
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Пропускаем не-HTTP и исключенные пути
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
 
-    async def _record_request(self, request: Request, response: Response, elapsed_ms: float):
+        # Засекаем время
+        start_time = time.perf_counter()
+        response_start: Optional[Message] = None
+        first_byte_time: Optional[float] = None
+        last_byte_time: Optional[float] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal response_start, first_byte_time, last_byte_time
+            if message["type"] == "http.response.start":
+                response_start = message
+            elif message["type"] == "http.response.body":
+                now = time.perf_counter()
+                if first_byte_time is None:
+                    first_byte_time = now
+                if not message.get("more_body", False):
+                    last_byte_time = now
+            await send(message)
+
+        self._in_flight += 1
+        if self.shared_stats:
+            self.shared_stats.inc_in_flight()
+        try:
+            # Выполняем запрос
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._in_flight -= 1
+            if self.shared_stats:
+                self.shared_stats.dec_in_flight()
+
+            # Вычисляем время выполнения (до последнего байта ответа)
+            end_time = last_byte_time or time.perf_counter()
+            elapsed_ms = (end_time - start_time) * 1000
+            ttfb_ms = (first_byte_time - start_time) * 1000 if first_byte_time is not None else None
+
+            # Собираем информацию о запросе (если ответ не начался - считаем его 500)
+            status_code = response_start["status"] if response_start else 500
+            headers = response_start.get("headers", []) if response_start else []
+            self._record_request(scope, status_code, headers, elapsed_ms, ttfb_ms)
+
+    def _record_request(self, scope: Scope, status_code: int, headers: List[Tuple[bytes, bytes]],
+                        elapsed_ms: float, ttfb_ms: Optional[float]):
         """Запись информации о выполненном запросе"""
 
         # Получаем заголовки
-        content_type = response.headers.get('content-type')
-        content_length = response.headers.get('content-length')
+        content_type = None
+        content_length = None
+        for k, v in headers:
+            k = k.lower()
+            if k == b"content-type":
+                content_type = v
+            elif k == b"content-length":
+                content_length = v
 
         # Конвертируем content_length в int если возможно
         try:
@@ -175,49 +520,68 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
         except (ValueError, TypeError):
             content_length_int = None
 
-        # Создаем запись
-        record = RequestRecord(
-            url=str(request.url),
-            method=request.method,
-            elapsed_ms=elapsed_ms,
-            content_type=content_type,
-            content_length=content_length_int,
-            status_code=response.status_code,
-            timestamp=datetime.utcnow()
-        )
-
-        # Добавляем в очередь (автоматически ограничивается maxlen)
-        self._records.append(record)
+        route = self._route_stats_key(scope)
+        route_stats = self._get_route_stats(route)
+        now = time.time()
+
+        # Добавляем в окно (старые записи перезаписываются)
+        self._records.append(elapsed_ms, ttfb_ms, now, status_code, route_stats.route_id, content_length_int)
+
+        # Обновляем гистограммы и счетчики
+        self._latency.record(elapsed_ms)
+        self._rolling_latency.record(elapsed_ms)
+        self._rate_windows.record(status_code, elapsed_ms)
+        route_stats.record(status_code, elapsed_ms)
+
+        # Полную запись создаем только для кандидатов в самые долгие запросы
+        global_slowest = self._slowest.accepts(elapsed_ms)
+        route_slowest = route_stats.slowest.accepts(elapsed_ms)
+        if global_slowest or route_slowest:
+            record = RequestRecord(
+                url=str(URL(scope=scope)),
+                method=scope["method"],
+                elapsed_ms=elapsed_ms,
+                content_type=content_type.decode("latin-1") if content_type else None,
+                content_length=content_length_int,
+                status_code=status_code,
+                timestamp=datetime.utcfromtimestamp(now),
+                ttfb_ms=ttfb_ms,
+                route=route
+            )
+            if global_slowest:
+                self._slowest.push(record)
+            if route_slowest:
+                route_stats.slowest.push(record)
 
-        # Обновляем счетчики
+        if self.shared_stats:
+            self.shared_stats.record(status_code, elapsed_ms)
         self._total_counter += 1
-        if 200 <= response.status_code < 300:
+        if 200 <= status_code < 300:
             self._success_counter += 1
 
-        if 500 <= response.status_code < 600:
-            # response_body = await _read_response_body(response, max_len=200)
-            self.stats_holder._statuses[str(response.status_code)].inc(request.url)
-
-        if (self._total_counter % 50 == 0 or (not self.stats_holder._stats) or
-                (self._last_stats_set_time and datetime.now() - self._last_stats_set_time > timedelta(seconds=10))):
-            self._last_stats_set_time = datetime.now()
-            self.stats_holder.update(self.get_extended_stats())
-
-    def _invalidate_cache(self):
-        """Инвалидация кэша статистики"""
-        self._stats_cache = None
-
-    def _get_records_snapshot(self) -> Tuple[RequestRecord, ...]:
-        """Получение неизменяемого снимка записей"""
-        # Создаем tuple для гарантии неизменяемости
-        return tuple(self._records)
-
-    @lru_cache(maxsize=1)
-    def _calculate_stats(self, records_hash: int) -> AggregatedStats:
-        """Вычисление статистики (с кэшированием)"""
-        records = self._get_records_snapshot()
-
-        if not records:
+        if 500 <= status_code < 600:
+            self.stats_holder._statuses[str(status_code)].inc(URL(scope=scope), route)
+
+    @staticmethod
+    def _route_stats_key(scope: Scope) -> str:
+        return f"{scope['method']} {_get_route_template(scope)}"
+
+    def _get_route_stats(self, key: str) -> RouteStats:
+        stats = self._routes.get(key)
+        if stats is None:
+            if len(self._routes) >= self.max_routes:
+                key = ROUTE_OVERFLOW
+                stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(route_id=len(self._route_keys))
+                self._route_keys.append(key)
+        return stats
+
+    def _calculate_stats(self) -> AggregatedStats:
+        """Вычисление статистики по окну записей"""
+        records = self._records
+
+        if not len(records):
             return AggregatedStats(
                 avg_response_time=0.0,
                 max_response_time=0.0,
@@ -226,42 +590,24 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
                 most_long_requests=[]
             )
 
-        # Сортируем по времени выполнения (самые долгие первыми)
-        sorted_records = sorted(records, key=lambda r: r.elapsed_ms, reverse=True)
+        # Самые долгие запросы уже отобраны при вставке
+        long_requests = [_long_request_view(r) for r in self._slowest.top()]
 
-        # Берем топ-5 самых долгих запросов
-        top_records = sorted_records[:5]
-
-        # Подготавливаем список долгих запросов
-        long_requests = []
-        for record in top_records:
-            long_requests.append({
-                "url": record.url,
-                "elapsed": round(record.elapsed_ms, 2),
-                "content_type": record.content_type,
-                "content_length": record.content_length,
-                "method": record.method,
-                "status_code": record.status_code
-            })
-
-        # Вычисляем статистику
-        times = [r.elapsed_ms for r in records]
+        # Вычисляем статистику по колонкам окна
+        avg_ms, min_ms, max_ms = records.elapsed_aggregates()
 
         return AggregatedStats(
-            avg_response_time=round(statistics.mean(times), 2),
-            max_response_time=round(max(times), 2),
-            min_response_time=round(min(times), 2),
+            avg_response_time=round(avg_ms, 2),
+            max_response_time=round(max_ms, 2),
+            min_response_time=round(min_ms, 2),
             total_requests=len(records),
-            most_long_requests=long_requests
+            most_long_requests=long_requests,
+            percentiles=records.elapsed_percentiles()
         )
 
     def get_stats(self) -> AggregatedStats:
         """Получение статистики"""
-        # Используем hash от записей для инвалидации кэша
-        records = self._get_records_snapshot()
-        records_hash = hash(records)
-
-        return self._calculate_stats(records_hash)
+        return self._calculate_stats()
 
     def get_extended_stats(self) -> Dict[str, Any]:
         """Расширенная статистика"""
@@ -276,7 +622,12 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
             if self._total_counter > 0 else 0
         )
 
-        return {
+        # Скользящие окна: счетчики по секундам + перцентили по гистограммам окон
+        windows = self._rate_windows.summary(self._start_time)
+        for name, latency in self._rolling_latency.summary().items():
+            windows.setdefault(name, {})["latency"] = latency
+
+        result = {
             "basic_stats": stats.to_dict(),
             "extended_metrics": {
                 "total_requests_processed": self._total_counter,
@@ -285,15 +636,33 @@ class StatisticsMiddleware(BaseHTTPMiddleware):
                 "success_rate_percent": round(success_rate, 2),
                 "requests_per_second": round(requests_per_second, 3),
                 "uptime_seconds": round(uptime, 2),
+                "in_flight": self._in_flight,
                 "window_size": len(self._records),
                 "window_max_size": self.max_records
-            }
+            },
+            "request_window": self._records.column_summary(self._route_keys),
+            "latency_percentiles": {
+                "lifetime": self._latency.summary()
+            },
+            "windows": windows,
+            "routes": {k: v.summary() for k, v in self._routes.items()}
         }
 
+        # Сводка по всем воркерам
+        if self.shared_stats:
+            result["cluster"] = self.shared_stats.aggregate()
+
+        return result
+
     def reset_stats(self):
         """Сброс статистики"""
         self._records.clear()
+        self._slowest.clear()
         self._total_counter = 0
         self._success_counter = 0
         self._start_time = time.time()
-        self._invalidate_cache()
+        self._latency.reset()
+        self._rolling_latency.reset()
+        self._rate_windows.reset()
+        self._routes.clear()
+        self._route_keys.clear()
@@ -1,8 +1,15 @@
-import mimetypes
+import asyncio
+import inspect
+import io
+import json
+import logging
 import os
-from dataclasses import dataclass, asdict
-from typing import Any, Optional, Dict, Callable
+from dataclasses import dataclass, field, asdict
+from functools import partial
+from itertools import islice
+from typing import Any, Optional, Dict, Callable, List, AsyncIterator, Mapping, Union
 
+from fastapi import Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from fastapi.responses import Response
@@ -10,15 +17,20 @@ from fastapi.types import IncEx
 from pydantic import BaseModel, Extra
 from src.mybootstrap_core_itskovichanton.utils import to_dict_deep
 from src.mybootstrap_ioc_itskovichanton.utils import default_dataclass_field
-from src.mybootstrap_mvc_fastapi_itskovichanton.utils import to_pydantic_model
+from src.mybootstrap_mvc_fastapi_itskovichanton import encoders, compression, files
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import current_request, to_pydantic_model
 from src.mybootstrap_mvc_itskovichanton.error_provider import Err
 from src.mybootstrap_mvc_itskovichanton.exceptions import CoreException
 from src.mybootstrap_mvc_itskovichanton.pipeline import Result
 from src.mybootstrap_mvc_itskovichanton.result_presenter import ResultPresenter
-from starlette.responses import FileResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.responses import FileResponse, StreamingResponse
+from xsdata.formats.dataclass.context import XmlContext
 from xsdata.formats.dataclass.serializers import XmlSerializer
 from xsdata.formats.dataclass.serializers.config import SerializerConfig
 
+logger = logging.getLogger(__name__)
+
 
 def remove_unprotected_field(obj):
     # Список полей, которые не следует удалять
@@ -41,6 +53,62 @@ def remove_unprotected_field(obj):
                     setattr(obj, attr, None)
 
 
+# Поля ошибки, которые не убираются, даже если не кодируются
+_PROTECTED_ERROR_FIELDS = frozenset({'message', 'details', 'reason'})
+
+# Метаданные xsdata кэшируются в контексте по типам - общий контекст строит их один раз на тип для всех презентеров
+_XML_CONTEXT = XmlContext()
+
+_SERIALIZER_CONFIG_PARAMS = inspect.signature(SerializerConfig).parameters
+
+
+def xml_serializer_config(pretty: bool = False, indent: str = "  ", **kwargs) -> SerializerConfig:
+    """
+    SerializerConfig для установленной версии xsdata: отступы задает поле indent (xsdata >= 24.1),
+    в старых версиях - pretty_print
+    """
+    if "indent" in _SERIALIZER_CONFIG_PARAMS:
+        kwargs["indent"] = indent if pretty else None
+    else:
+        kwargs["pretty_print"] = pretty
+    return SerializerConfig(**kwargs)
+
+
+def _result_size(r: Any) -> int:
+    """Оценка объема документа до рендера: число элементов результата или его самого большого списка"""
+    x = r.result if isinstance(r, Result) else r
+    if isinstance(x, (list, tuple, set, dict)):
+        return len(x)
+    return max((len(v) for v in getattr(x, "__dict__", {}).values() if isinstance(v, (list, tuple))), default=1)
+
+
+class ThreadpoolRenderedResponse(Response):
+    """
+    Ответ, тело которого рендерится в пуле потоков при отправке (в __call__): презентер остается синхронным,
+    а рендер большого документа не блокирует цикл событий. Тело рендерится один раз (render_body).
+    """
+
+    def __init__(self, render: Callable[[], Any], status_code: int = 200, media_type: Optional[str] = None):
+        super().__init__(status_code=status_code, media_type=media_type)
+        self._render_content = render
+        self._rendered = False
+
+    async def render_body(self):
+        if self._rendered:
+            return
+        body = self.render(await run_in_threadpool(self._render_content))
+        if self._rendered:
+            # Параллельная отправка того же объекта уже отрендерила тело
+            return
+        self.body = body
+        self.headers["content-length"] = str(len(body))
+        self._rendered = True
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.render_body()
+        await super().__call__(scope, receive, send)
+
+
 @dataclass
 class AsIsResultPresenterImpl(ResultPresenter):
 
@@ -60,17 +128,111 @@ class AsIsResultPresenterImpl(ResultPresenter):
             return self.default_presenter.present(r)
 
 
+class _RenderCancelled(Exception):
+    ...
+
+
+class _QueueWriter(io.TextIOBase):
+    """Текстовый поток для рендера в отдельном потоке: копит вывод и передает его в asyncio-очередь порциями"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, chunk_size: int, encoding: str):
+        super().__init__()
+        self._loop = loop
+        self._queue = queue
+        self._chunk_size = chunk_size
+        self._encoding = encoding
+        self._buf: List[str] = []
+        self._size = 0
+        self.cancelled = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if self.cancelled:
+            raise _RenderCancelled()
+        self._buf.append(s)
+        self._size += len(s)
+        if self._size >= self._chunk_size:
+            self.flush_chunk()
+        return len(s)
+
+    def flush_chunk(self):
+        if self._buf:
+            chunk = "".join(self._buf).encode(self._encoding)
+            self._buf = []
+            self._size = 0
+            self.put(chunk)
+
+    def put(self, item):
+        if self.cancelled:
+            raise _RenderCancelled()
+        # Очередь ограничена: если клиент читает медленно, рендер ждет, а не копит документ в памяти
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+
 @dataclass
 class XMLResultPresenterImpl(ResultPresenter):
+    """
+    XML через xsdata. По умолчанию вывод компактный (без отступов, см. xml_serializer_config), метаданные типов
+    кэшируются в общем XmlContext. Результаты от offload_min_items элементов рендерятся в пуле потоков при
+    отправке ответа (None - всегда на цикле событий).
+
+    streaming=True: документ рендерится в пуле потоков и уходит в StreamingResponse порциями по chunk_size
+    символов по мере генерации - большой документ не блокирует цикл событий и не собирается в памяти целиком.
+    """
 
-    def __init__(self, config: SerializerConfig = SerializerConfig(pretty_print=True)) -> None:
+    def __init__(self, config: SerializerConfig = None, streaming: bool = False, chunk_size: int = 64 * 1024,
+                 max_pending_chunks: int = 8, offload_min_items: Optional[int] = 1000) -> None:
         super().__init__()
-        self.xml_serializer = XmlSerializer(config=config)
+        self.xml_serializer = XmlSerializer(config=config or xml_serializer_config(), context=_XML_CONTEXT)
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.max_pending_chunks = max_pending_chunks
+        self.offload_min_items = offload_min_items
 
     def present(self, r: Result) -> Any:
         r = self.preprocess_result(r)
+        if self.streaming:
+            return StreamingResponse(self._stream(r), media_type="application/xml")
+        if self.offload_min_items is not None and _result_size(r) >= self.offload_min_items:
+            return ThreadpoolRenderedResponse(partial(self.xml_serializer.render, r), media_type="application/xml")
         return Response(content=self.xml_serializer.render(r), media_type="application/xml")
 
+    async def _stream(self, r: Result) -> AsyncIterator[bytes]:
+        queue = asyncio.Queue(maxsize=self.max_pending_chunks)
+        writer = _QueueWriter(asyncio.get_running_loop(), queue, self.chunk_size, self.xml_serializer.config.encoding)
+
+        def render():
+            try:
+                self.xml_serializer.write(writer, r)
+                writer.flush_chunk()
+                writer.put(None)
+            except _RenderCancelled:
+                ...
+            except BaseException as ex:
+                try:
+                    writer.put(ex)
+                except _RenderCancelled:
+                    ...
+
+        task = asyncio.ensure_future(run_in_threadpool(render))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    # Статус уже отправлен - обрываем ответ, чтобы клиент не принял усеченный документ за целый
+                    raise item
+                yield item
+        finally:
+            # Клиент отключился или рендер упал: останавливаем поток рендера и освобождаем очередь
+            writer.cancelled = True
+            while not queue.empty():
+                queue.get_nowait()
+            await task
+
 
 class _ErrM(BaseModel):
     class Config:
@@ -106,10 +268,18 @@ class JSONResultPresenterImpl(ResultPresenter):
     sqlalchemy_safe: bool = True
     include: Optional[IncEx] = None
     custom_encoder: Optional[Dict[Any, Callable[[Any], Any]]] = None
+    # Быстрый путь: один проход по результату и сериализация сразу в байты через orjson (если установлен).
+    # Кодирует через кэш кодировщиков (см. use_encoder_cache)
+    use_orjson: bool = False
+    # Кодирование через кэш кодировщиков по типам (encoders.EncoderRegistry) вместо to_pydantic_model +
+    # jsonable_encoder. Быстрее, но вывод отличается в деталях: Decimal всегда строкой, custom_encoder
+    # применяется и к вложенным значениям
+    use_encoder_cache: bool = False
 
     def present(self, r: Result) -> Any:
-        r = self.preprocess_result(r)
+        return self._present_json(self.preprocess_result(r))
 
+    def _present_json(self, r: Result) -> Response:
         if self.cause_as_str:
             try:
                 if hasattr(r, "error") and r.error:
@@ -118,48 +288,459 @@ class JSONResultPresenterImpl(ResultPresenter):
                         r.error.cause = str(cause)
             except:
                 ...
-        for i in range(1, 10):
+
+        # Кэш кодировщиков заменяет неудачные поля строкой (или пропускает) за тот же проход и сообщает о них в
+        # degraded. jsonable_encoder так не умеет - для него неудачные поля ошибки убираем заранее
+        degraded: List[str] = []
+        if r.error and not self._uses_encoder_cache():
+            self._degrade_error_fields(r.error, degraded)
+        try:
+            response = self._render(r, degraded)
+        except Exception as ex:
+            logger.warning("cannot JSONResponse response because of %s", ex)
+            # Кодированием не лечится (например, NaN при allow_nan=False) - отдаем только ошибку
+            r.error = Err(message=str(ex))
+            r.result = None
+            response = self._render(r, degraded)
+        if degraded:
+            logger.warning("JSON response degraded fields: %s", "; ".join(degraded))
+        return response
+
+    def _degrade_error_fields(self, error: Any, degraded: List[str]):
+        """
+        Один проход по незащищенным полям ошибки: поле, которое jsonable_encoder не кодирует, убирается
+        (CoreException заменяется строкой), и весь ответ затем кодируется за одну попытку
+        """
+        for name, v in list(getattr(error, "__dict__", {}).items()):
+            if name in _PROTECTED_ERROR_FIELDS or v is None:
+                continue
             try:
-                return JSONResponse(
-                    status_code=self.http_code(r) or 200,
-                    content=jsonable_encoder(to_dict_deep(r) if self.to_dict else to_pydantic_model(r),
-                                             exclude_unset=self.exclude_unset,
-                                             include=self.include,
-                                             exclude_none=self.exclude_none,
-                                             exclude_defaults=self.exclude_defaults,
-                                             exclude=self.exclude, by_alias=self.by_alias,
-                                             sqlalchemy_safe=self.sqlalchemy_safe, custom_encoder=self.custom_encoder),
-                )
-            except BaseException as ex:
-                print(f"cannot JSONResponse response because of {ex}")
-                if r.error:
-                    if i > 8:
-                        r.error = Err(message=str(ex))
-                    else:
-                        remove_unprotected_field(r.error)
+                self._jsonable_encoder(v)
+                continue
+            except Exception as ex:
+                degraded.append(f"{type(error).__name__}.{name}: {type(ex).__name__}: {ex}")
+            if isinstance(v, CoreException):
+                setattr(error, name, str(v))
+                continue
+            try:
+                delattr(error, name)
+            except Exception:
+                setattr(error, name, None)
+
+    def _render(self, r: Result, degraded: List[str]) -> Response:
+        if self._orjson_enabled():
+            return Response(content=encoders.dumps(self._to_jsonable(r, False, degraded)),
+                            status_code=self.http_code(r) or 200, media_type="application/json")
+        return JSONResponse(status_code=self.http_code(r) or 200, content=self._to_jsonable(r, True, degraded))
+
+    def _orjson_enabled(self) -> bool:
+        return self.use_orjson and encoders.orjson is not None
+
+    def _uses_encoder_cache(self) -> bool:
+        return self.use_encoder_cache or self._orjson_enabled()
+
+    def _to_jsonable(self, r: Result, json_compatible: bool, degraded: Optional[List[str]] = None) -> Any:
+        if json_compatible and not self.use_encoder_cache:
+            return self._jsonable_encoder(r, include=self.include, exclude=self.exclude)
+        return encoders.to_jsonable(to_dict_deep(r) if self.to_dict else r,
+                                    exclude_none=self.exclude_none, by_alias=self.by_alias,
+                                    exclude_unset=self.exclude_unset, exclude_defaults=self.exclude_defaults,
+                                    custom_encoder=self.custom_encoder, include=self.include, exclude=self.exclude,
+                                    sqlalchemy_safe=self.sqlalchemy_safe, json_compatible=json_compatible,
+                                    degraded=degraded)
+
+    def _jsonable_encoder(self, obj: Any, include: Optional[IncEx] = None, exclude: Optional[IncEx] = None) -> Any:
+        return jsonable_encoder(to_dict_deep(obj) if self.to_dict else to_pydantic_model(obj),
+                                exclude_unset=self.exclude_unset,
+                                include=include,
+                                exclude_none=self.exclude_none,
+                                exclude_defaults=self.exclude_defaults,
+                                exclude=exclude, by_alias=self.by_alias,
+                                sqlalchemy_safe=self.sqlalchemy_safe, custom_encoder=self.custom_encoder)
+
+
+@dataclass
+class MsgPackResultPresenterImpl(JSONResultPresenterImpl):
+    """Результат в MessagePack - те же данные, что и в JSON, но компактнее и дешевле в разборе. Нужен msgpack"""
+
+    def _render(self, r: Result, degraded: List[str]) -> Response:
+        return Response(content=encoders.pack_msgpack(self._to_jsonable(r, True, degraded)),
+                        status_code=self.http_code(r) or 200, media_type=encoders.MSGPACK_MEDIA_TYPE)
+
+
+@dataclass
+class CBORResultPresenterImpl(JSONResultPresenterImpl):
+    """Результат в CBOR - те же данные, что и в JSON. Нужен cbor2"""
+
+    def _render(self, r: Result, degraded: List[str]) -> Response:
+        return Response(content=encoders.pack_cbor(self._to_jsonable(r, True, degraded)),
+                        status_code=self.http_code(r) or 200, media_type=encoders.CBOR_MEDIA_TYPE)
+
+
+def _add_vary(response: Response, header: str):
+    vary = response.headers.get("Vary")
+    if not vary:
+        response.headers["Vary"] = header
+    elif header.lower() not in [v.strip().lower() for v in vary.split(",")]:
+        response.headers["Vary"] = vary + ", " + header
+
+
+# Медиатип из Accept -> поле NegotiatingResultPresenterImpl с презентером
+_NEGOTIABLE_MEDIA_TYPES = {
+    "*/*": "json_presenter",
+    "application/*": "json_presenter",
+    encoders.JSON_MEDIA_TYPE: "json_presenter",
+    "application/xml": "xml_presenter",
+    "text/xml": "xml_presenter",
+    **{t: "msgpack_presenter" for t in encoders.MSGPACK_MEDIA_TYPES},
+    encoders.CBOR_MEDIA_TYPE: "cbor_presenter",
+}
+
+
+def _negotiate(accept: str) -> str:
+    """Поле презентера для значения Accept: поддерживаемый тип с наибольшим q, при равенстве - первый"""
+    best, best_q = "json_presenter", 0.0
+    for part in accept.split(","):
+        media_type, *params = part.split(";")
+        name = _NEGOTIABLE_MEDIA_TYPES.get(media_type.strip().lower())
+        if name is None or \
+                (name == "msgpack_presenter" and encoders.msgpack is None) or \
+                (name == "cbor_presenter" and encoders.cbor2 is None):
+            continue
+        q = 1.0
+        for param in params:
+            k, _, v = param.partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+@dataclass
+class NegotiatingResultPresenterImpl(ResultPresenter):
+    """
+    Выбор формата по заголовку Accept текущего запроса (нужен RequestContextMiddleware): JSON, XML, MessagePack
+    (application/msgpack) или CBOR (application/cbor). Без Accept, с */* или с неподдерживаемыми типами - JSON.
+
+    Разбор Accept кэшируется по значению заголовка, к ответу добавляется Vary: Accept.
+    """
+    json_presenter: ResultPresenter = default_dataclass_field(JSONResultPresenterImpl())
+    xml_presenter: ResultPresenter = default_dataclass_field(XMLResultPresenterImpl())
+    msgpack_presenter: ResultPresenter = default_dataclass_field(MsgPackResultPresenterImpl())
+    cbor_presenter: ResultPresenter = default_dataclass_field(CBORResultPresenterImpl())
+    cache_size: int = 256
+    _choices: Dict[str, str] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def present(self, r: Result) -> Any:
+        response = self.choose().present(r)
+        _add_vary(response, "Accept")
+        return response
+
+    def choose(self) -> ResultPresenter:
+        request = current_request()
+        accept = request.headers.get("Accept") if request is not None else None
+        if not accept:
+            return self.json_presenter
+        name = self._choices.get(accept)
+        if name is None:
+            if len(self._choices) >= self.cache_size:
+                self._choices.clear()
+            name = self._choices[accept] = _negotiate(accept)
+        return getattr(self, name)
+
+
+@dataclass
+class CompressingResultPresenterImpl(ResultPresenter):
+    """
+    Сжатие ответов вложенного презентера по Accept-Encoding текущего запроса (нужен RequestContextMiddleware):
+    gzip, а также br и zstd, если установлены brotli и zstandard (порядок предпочтения - encodings, уровни -
+    levels). Ко всем ответам добавляется Vary: Accept-Encoding.
+
+    Сжимаются буферизованные ответы текстовых типов (JSON, XML, text/*) от min_size байт. Само сжатие
+    откладывается до отправки ответа, тела от offload_min_size байт сжимаются в пуле потоков. Уже сжатые тела
+    повторяющихся результатов берутся из LRU объемом до cache_max_bytes (0 - без кэша).
+    """
+    presenter: ResultPresenter = default_dataclass_field(JSONResultPresenterImpl())
+    min_size: int = 1024
+    levels: Dict[str, int] = field(default_factory=dict)
+    encodings: tuple = compression.DEFAULT_ENCODINGS
+    offload_min_size: int = 64 * 1024
+    cache_max_bytes: int = 16 * 1024 * 1024
+    _cache: Optional[compression.CompressedBodyCache] = field(default=None, init=False, repr=False, compare=False)
+    _choices: Dict[str, Optional[str]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def present(self, r: Result) -> Any:
+        response = self.presenter.present(r)
+        if not isinstance(response, Response):
+            return response
+        # Кэши должны различать ответы по Accept-Encoding, даже если именно этот ответ не сжат
+        _add_vary(response, "Accept-Encoding")
+        # Тело ThreadpoolRenderedResponse еще не готово - его размер не проверяем, такие ответы заведомо большие
+        if isinstance(response, (StreamingResponse, FileResponse)) or "content-encoding" in response.headers or \
+                (not isinstance(response, ThreadpoolRenderedResponse) and len(response.body) < self.min_size) or \
+                not compression.is_compressible(response.headers.get("content-type")):
+            return response
+
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+        if self._cache is None and self.cache_max_bytes:
+            self._cache = compression.CompressedBodyCache(self.cache_max_bytes)
+        level = self.levels.get(encoding, compression.DEFAULT_LEVELS[encoding])
+        return compression.CompressedResponse(response, encoding,
+                                              partial(compression.available_codecs()[encoding], level=level),
+                                              self._cache, self.offload_min_size)
+
+    def _choose_encoding(self) -> Optional[str]:
+        request = current_request()
+        accept_encoding = request.headers.get("Accept-Encoding") if request is not None else None
+        if not accept_encoding:
+            return None
+        if accept_encoding not in self._choices:
+            if len(self._choices) >= 256:
+                self._choices.clear()
+            codecs = compression.available_codecs()
+            self._choices[accept_encoding] = compression.choose_encoding(
+                accept_encoding, [e for e in self.encodings if e in codecs])
+        return self._choices[accept_encoding]
+
+
+async def _iterate_batches(source, batch_size: int) -> AsyncIterator[list]:
+    """Элементы источника порциями: списки режутся срезами, синхронные итераторы читаются в пуле потоков"""
+    if isinstance(source, (list, tuple)):
+        for i in range(0, len(source), batch_size):
+            yield source[i:i + batch_size]
+    elif hasattr(source, "__aiter__"):
+        batch = []
+        async for item in source:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    else:
+        it = iter(source)
+        while True:
+            # Один переход в пул потоков на порцию, а не на элемент
+            batch = await run_in_threadpool(lambda: list(islice(it, batch_size)))
+            if not batch:
+                return
+            yield batch
+
+
+def _is_streamable(x) -> bool:
+    return isinstance(x, (list, tuple)) or inspect.isgenerator(x) or hasattr(x, "__aiter__") or \
+        (hasattr(x, "__next__") and not isinstance(x, (str, bytes, dict)))
+
+
+@dataclass
+class StreamingJSONResultPresenterImpl(JSONResultPresenterImpl):
+    """
+    Потоковая выдача списков, синхронных и асинхронных генераторов.
+
+    Конверт {"result": [...]} (или NDJSON при ndjson=True - по строке на элемент) пишется в StreamingResponse
+    порциями по batch_size элементов: память не растет с размером выборки, первые байты уходят сразу.
+    Ошибка в середине потока (статус уже отправлен) дописывается в конец: полем "error" конверта или
+    последней строкой {"error": ...} в NDJSON. Ошибки и прочие результаты отдаются как в JSONResultPresenterImpl.
+    """
+    ndjson: bool = False
+    batch_size: int = 500
+
+    def present(self, r: Result) -> Any:
+        r = self.preprocess_result(r)
+        if r.error or not _is_streamable(r.result) or \
+                (self.include is not None and "result" not in self.include) or \
+                (self.exclude is not None and "result" in self.exclude):
+            return self._present_json(r)
+        return StreamingResponse(self._stream(r.result), status_code=self.http_code(r) or 200,
+                                 media_type="application/x-ndjson" if self.ndjson else "application/json")
+
+    def _dumps(self, obj: Any) -> bytes:
+        if self._orjson_enabled():
+            return encoders.dumps(obj)
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    async def _stream(self, source) -> AsyncIterator[bytes]:
+        registry = encoders.get_registry(exclude_none=self.exclude_none, by_alias=self.by_alias,
+                                         exclude_unset=self.exclude_unset, exclude_defaults=self.exclude_defaults,
+                                         custom_encoder=self.custom_encoder, sqlalchemy_safe=self.sqlalchemy_safe,
+                                         json_compatible=not self._orjson_enabled())
+        use_registry = self._uses_encoder_cache()
+        degraded: List[str] = []
+        error = None
+        started = False
+        try:
+            async for batch in _iterate_batches(source, self.batch_size):
+                if use_registry:
+                    items = registry.encode_many(to_dict_deep(batch) if self.to_dict else batch, degraded)
+                else:
+                    items = [self._jsonable_encoder(x) for x in batch]
+                if self.ndjson:
+                    yield b"\n".join(self._dumps(x) for x in items) + b"\n"
+                else:
+                    # Порция сериализуется одним вызовом, скобки списка отрезаются
+                    yield (b"," if started else b'{"result":[') + self._dumps(items)[1:-1]
+                started = True
+        except Exception as ex:
+            logger.warning("JSON stream interrupted because of %s", ex)
+            error = registry.encode(Err(message=str(ex)))
+        finally:
+            if degraded:
+                logger.warning("JSON response degraded fields: %s", "; ".join(degraded))
+
+        if self.ndjson:
+            if error is not None:
+                yield self._dumps({"error": error}) + b"\n"
+            return
+        tail = b"]" if started else b'{"result":[]'
+        if error is not None:
+            tail += b',"error":' + self._dumps(error)
+        elif not self.exclude_none:
+            tail += b',"error":null'
+        yield tail + b"}"
 
 
 @dataclass
 class AnyResultPresenterImpl(ResultPresenter):
+    """
+    Отдача файла по пути из результата.
+
+    stat, mime-тип и валидаторы (ETag/Last-Modified) кэшируются по пути на stat_cache_ttl секунд. Условные GET
+    (If-None-Match/If-Modified-Since) получают 304 без чтения файла, один диапазон Range - 206 (докачка).
+    Если сервер поддерживает ASGI-расширение zerocopysend, файл отдается через sendfile.
+
+    Заголовки берутся из request, а без него - из текущего запроса (нужен RequestContextMiddleware). Без
+    запроса файл отдается целиком.
+    """
     error_presenter: ResultPresenter = default_dataclass_field(JSONResultPresenterImpl())
+    stat_cache_ttl: float = 2.0
+    _file_info: Optional[files.FileInfoCache] = field(default=None, init=False, repr=False, compare=False)
 
-    def present(self, r: Result) -> Any:
+    def present(self, r: Result, request: Optional[Request] = None) -> Any:
         r = self.preprocess_result(r)
         if r.error:
             return self.error_presenter.present(r)
 
         file_path = self.get_file_path(r.result)
-        mime = mimetypes.guess_type(file_path)
-        mime = mime[0] if len(mime) > 0 else None
-        return FileResponse(path=file_path, filename=os.path.basename(file_path),
-                            media_type=mime, status_code=self.http_code(r))
+        filename = os.path.basename(file_path)
+        status_code = self.http_code(r) or 200
+        if self._file_info is None:
+            self._file_info = files.FileInfoCache(self.stat_cache_ttl)
+        try:
+            info = self._file_info.get(file_path)
+        except OSError:
+            # Файла нет - ошибку, как и раньше, выдаст FileResponse при отправке
+            return FileResponse(path=file_path, filename=filename, status_code=status_code)
+
+        request = request or current_request()
+        if status_code == 200 and request is not None and request.method in ("GET", "HEAD"):
+            if files.is_not_modified(request.headers, info):
+                return Response(status_code=304, headers={"etag": info.etag, "last-modified": info.last_modified})
+            byte_range = files.parse_single_range(request.headers, info)
+            if byte_range is not None or files.ZEROCOPY_EXTENSION in (request.scope.get("extensions") or {}):
+                start, end = byte_range or (0, None)
+                return files.FileRangeResponse(file_path, info, start, end, filename=filename)
+        return FileResponse(path=file_path, filename=filename, media_type=info.media_type,
+                            status_code=status_code, stat_result=info.stat_result)
 
     def get_file_path(self, result):
         return str(result)
 
 
+def _as_buffer(x) -> Optional[Union[memoryview, bytes]]:
+    """
+    Байтовое представление объекта с буферным протоколом или None. Непрерывный буфер отдается memoryview
+    без копирования, несмежный (срез с шагом, транспонированный массив) копируется в bytes - побайтовые
+    срезы и cast требуют C-непрерывности
+    """
+    try:
+        view = memoryview(x)
+    except TypeError:
+        return None
+    if not view.c_contiguous:
+        return view.tobytes()
+    return view if view.format == "B" and view.ndim == 1 else view.cast("B")
+
+
+def _as_chunk(chunk) -> Union[memoryview, bytes]:
+    if isinstance(chunk, bytes):
+        return chunk
+    if isinstance(chunk, str):
+        return chunk.encode("utf-8")
+    buffer = _as_buffer(chunk)
+    if buffer is None:
+        raise TypeError(f"Чанк ответа должен быть str или объектом с буферным протоколом, а не {type(chunk).__name__}")
+    return buffer
+
+
+async def _byte_chunks(source) -> AsyncIterator[Union[memoryview, bytes]]:
+    if hasattr(source, "__aiter__"):
+        async for chunk in source:
+            yield _as_chunk(chunk)
+    elif isinstance(source, (list, tuple)):
+        for chunk in source:
+            yield _as_chunk(chunk)
+    else:
+        async for chunk in iterate_in_threadpool(source):
+            yield _as_chunk(chunk)
+
+
+def _zero_copy_send(scope) -> bool:
+    """Сервер принимает memoryview в теле ASGI-сообщения без копирования"""
+    return files.ZEROCOPY_EXTENSION in (scope.get("extensions") or {})
+
+
+async def _as_bytes(chunks: AsyncIterator[Union[memoryview, bytes]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield chunk if isinstance(chunk, bytes) else bytes(chunk)
+
+
+class _BufferResponse(Response):
+    """
+    Тело с буферным протоколом (memoryview, bytearray, mmap, array) отдается срезами memoryview. Серверу без
+    zerocopysend срезы передаются копиями в bytes - по одному чанку, а не всем телом
+    """
+    chunk_size = 256 * 1024
+
+    def render(self, content: Any) -> Union[memoryview, bytes]:
+        return _as_buffer(content)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        body = self.body
+        if scope["method"].upper() == "HEAD" or not len(body):
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            to_bytes = not isinstance(body, bytes) and not _zero_copy_send(scope)
+            for i in range(0, len(body), self.chunk_size):
+                chunk = body[i:i + self.chunk_size]
+                await send({"type": "http.response.body", "body": bytes(chunk) if to_bytes else chunk,
+                            "more_body": i + self.chunk_size < len(body)})
+        if self.background is not None:
+            await self.background()
+
+
+class _ChunkStreamingResponse(StreamingResponse):
+    """Поток чанков из _byte_chunks: memoryview-чанки копируются в bytes, если сервер не поддерживает zerocopysend"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        if not _zero_copy_send(scope):
+            self.body_iterator = _as_bytes(self.body_iterator)
+        await super().__call__(scope, receive, send)
+
+
 @dataclass
 class BytesResultPresenterImpl(ResultPresenter):
+    """
+    Бинарный результат: bytes, объекты с буферным протоколом (memoryview, bytearray, mmap, array - без
+    копирования всего тела) и синхронные/асинхронные итерируемые объекты чанков str или буферов (отдаются
+    потоком). Словари не принимаются. Content-Length выставляется, когда размер известен заранее.
+    """
     error_presenter: ResultPresenter = default_dataclass_field(JSONResultPresenterImpl())
     mime_type: str = None
 
@@ -168,9 +749,24 @@ class BytesResultPresenterImpl(ResultPresenter):
         if r.error:
             return self.error_presenter.present(r)
 
-        return Response(r.result, media_type=mime_type or self.get_mime_type(r.result) or self.mime_type,
-                        headers=headers or self.get_headers(r),
-                        status_code=self.http_code(r))
+        result = r.result
+        media_type = mime_type or self.get_mime_type(result) or self.mime_type
+        headers = headers or self.get_headers(r)
+        status_code = self.http_code(r)
+        if result is None or isinstance(result, (bytes, str)):
+            return Response(result, media_type=media_type, headers=headers, status_code=status_code)
+        if _as_buffer(result) is not None:
+            return _BufferResponse(result, media_type=media_type, headers=headers, status_code=status_code)
+        if isinstance(result, Mapping):
+            # Итерация по словарю дала бы только ключи
+            raise TypeError(f"{type(self).__name__} не отдает словари: используйте JSONResultPresenterImpl")
+        if hasattr(result, "__aiter__") or hasattr(result, "__iter__"):
+            if isinstance(result, (list, tuple)) and all(isinstance(c, (bytes, bytearray, memoryview)) for c in result):
+                headers = dict(headers or {})
+                headers.setdefault("content-length", str(sum(memoryview(c).nbytes for c in result)))
+            return _ChunkStreamingResponse(_byte_chunks(result), media_type=media_type, headers=headers,
+                                           status_code=status_code)
+        return Response(result, media_type=media_type, headers=headers, status_code=status_code)
 
     def get_mime_type(self, result):
         ...
@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import Request
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import get_ip
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+# Заголовки запроса, от которых по умолчанию зависит представление (согласование формата и сжатия)
+DEFAULT_VARY = ("accept", "accept-encoding")
+
+_CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+def _freeze(v: Any) -> Hashable:
+    if isinstance(v, (list, tuple, set, frozenset)):
+        return tuple(_freeze(x) for x in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    try:
+        hash(v)
+        return v
+    except TypeError:
+        return repr(v)
+
+
+class _CachedResponse(NamedTuple):
+    """Отрисованный ответ: из него на каждое попадание собирается новый Response"""
+    status_code: int
+    raw_headers: Tuple[Tuple[bytes, bytes], ...]
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.raw_headers)
+
+    def to_response(self) -> Response:
+        response = Response(self.body, status_code=self.status_code)
+        response.raw_headers = list(self.raw_headers)
+        return response
+
+
+async def _render(response: Response) -> Optional[_CachedResponse]:
+    """Тело, статус и заголовки ответа или None, если ответ нельзя отдавать повторно"""
+    if isinstance(response, (StreamingResponse, FileResponse)) or response.background is not None:
+        return None
+    if not 200 <= response.status_code < 300:
+        return None
+    # Тело, которое досчитывается при отправке (сжатие, рендер в пуле потоков), готовим заранее
+    render_body = getattr(response, "render_body", None)
+    if render_body is not None:
+        await render_body()
+    body = getattr(response, "body", None)
+    if body is None:
+        return None
+    return _CachedResponse(response.status_code, tuple(response.raw_headers), bytes(body))
+
+
+class ResultCache:
+    """
+    LRU отрисованных ответов (тело, статус и заголовки) с временем жизни и ограничением суммарного объема.
+    Каждое попадание получает новый Response, так что один объект ответа никогда не отправляется дважды.
+
+    Одновременные промахи по одному ключу схлопываются: выполняется один вызов, остальные ждут его ответ.
+    Кэшируются только ответы со статусом 2xx, не потоковые и без фоновых задач.
+    """
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[Hashable, Tuple[float, _CachedResponse]] = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Response]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._items.move_to_end(key)
+        return item[1].to_response()
+
+    async def put(self, key: Hashable, response: Response, ttl: Optional[float] = None) -> bool:
+        return await self._put(key, response, ttl) is not None
+
+    async def _put(self, key: Hashable, response: Response, ttl: Optional[float] = None) \
+            -> Optional[_CachedResponse]:
+        entry = await _render(response)
+        if entry is None or entry.size > self.max_bytes:
+            return None
+        if key in self._items:
+            self._remove(key)
+        self._items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), entry)
+        self._size += entry.size
+        while self._size > self.max_bytes or len(self._items) > self.max_entries:
+            self._remove(next(iter(self._items)))
+            self.evictions += 1
+        return entry
+
+    def _remove(self, key: Hashable):
+        _, entry = self._items.pop(key)
+        self._size -= entry.size
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None):
+        """Удаление записей, ключи которых удовлетворяют predicate (без predicate - всех)"""
+        for key in [k for k in self._items if predicate is None or predicate(k)]:
+            self._remove(key)
+
+    async def get_or_run(self, key: Hashable, run: Callable[[], Any]) -> Any:
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            entry = await asyncio.shield(in_flight)
+            # None - ответ ведущего вызова нельзя отдать повторно, выполняемся сами
+            return entry.to_response() if entry is not None else await run()
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await run()
+            entry = await self._put(key, response) if isinstance(response, Response) else None
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным: ожидающих может и не быть
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(entry)
+        return response
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "evictions": self.evictions, "in_flight": len(self._in_flight)}
+
+
+def cached(ttl: float = 5.0, key: Sequence[str] = None, by_client: bool = False, vary: Sequence[str] = DEFAULT_VARY,
+           cache: ResultCache = None, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024):
+    """
+    Кэширование ответов метода контроллера для GET/HEAD.
+
+    Ключ - имя метода контроллера, HTTP-метод (HEAD и GET не делят запись), значения аргументов из key
+    (по умолчанию всех, кроме self и Request), IP клиента (by_client) и заголовки запроса из vary.
+    Кэш доступен как атрибут cache обернутой функции.
+
+    @cached(ttl=10, key=("table", "q", "limit"))
+    async def test(self, table: str, request: Request, q: str, limit: int = 0): ...
+    """
+    cache = cache or ResultCache(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        request_params = [name for name, p in signature.parameters.items() if p.annotation in (Request, "Request")]
+        key_params = tuple(key) if key is not None else \
+            tuple(name for name in signature.parameters if name != "self" and name not in request_params)
+        unknown = set(key_params) - signature.parameters.keys()
+        if unknown:
+            raise ValueError(f"{fn.__qualname__} has no parameters {sorted(unknown)}")
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            request = next((v for v in bound.arguments.values() if isinstance(v, Request)), None)
+            if request is None or request.method not in _CACHEABLE_METHODS:
+                return await fn(*args, **kwargs)
+            arguments = bound.arguments
+            parameters = signature.parameters
+            k = (fn.__qualname__, request.method,
+                 tuple(_freeze(arguments[name] if name in arguments else parameters[name].default)
+                       for name in key_params),
+                 get_ip(request) if by_client else None,
+                 tuple(request.headers.get(h) for h in vary))
+            return await cache.get_or_run(k, lambda: fn(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,271 @@
+import bisect
+import mmap
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from src.mybootstrap_mvc_fastapi_itskovichanton.histogram import LatencyHistogram, METRICS_LATENCY_BUCKETS_MS, \
+    _bucket_index
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_MAGIC = int.from_bytes(b"MVCSTAT1", "little")
+_VERSION = 2
+_HEADER_LEN = 4
+
+# Раскладка слота воркера (в 8-байтных счетчиках)
+_PID = 0
+_STARTED = 1  # время запуска процесса-владельца (0 - неизвестно): отличает его от процесса с тем же PID
+_TOTAL = 2
+_STATUSES = 3  # 1xx..5xx - 5 счетчиков
+_IN_FLIGHT = 8
+_SUM_US = 9
+_MIN_US = 10
+_MAX_US = 11
+_BUCKETS = 12  # фиксированные бакеты для метрик (METRICS_LATENCY_BUCKETS_MS + +Inf)
+
+_U64_MAX = (1 << 64) - 1
+
+
+def _default_path(name: str) -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"mybootstrap-mvc-stats-{name}.bin")
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _process_start_time(pid: int) -> int:
+    """Время запуска процесса в тиках с загрузки системы (Linux), 0 - если узнать нельзя"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        # Имя процесса в скобках может содержать пробелы - поля считаем после него
+        return int(stat[stat.rindex(b")") + 2:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _owner_alive(pid: int, started: int) -> bool:
+    """Жив ли процесс, занявший слот: PID мог достаться другому процессу, поэтому сверяем и время запуска"""
+    if not _pid_alive(pid):
+        return False
+    if not started:
+        return True
+    current = _process_start_time(pid)
+    return not current or current == started
+
+
+class SharedStatsArea:
+    """
+    Общая для всех воркеров (процессов uvicorn/gunicorn) область счетчиков и гистограммы задержек.
+
+    Область - файл, отображенный в память (mmap). Каждый воркер при первой записи занимает свой слот и пишет
+    только в него, поэтому запись не требует блокировок. Чтение суммирует слоты и дает единую картину по всем
+    воркерам из любого воркера. Слот умершего воркера переходит новому вместе с накопленными счетчиками.
+
+    Владелец слота определяется по PID и времени запуска процесса, так что переиспользованный PID не выдает
+    умерший воркер за живой. При подключении счетчики не обнуляются (иначе rolling restart стирал бы их);
+    обнулить область можно явно через reset(). Заново размечается только область с другой раскладкой.
+
+    name должен быть общим для воркеров одного приложения и различаться у разных приложений на одной машине.
+    """
+
+    def __init__(self, name: str = "default", max_workers: int = 64, path: Optional[str] = None,
+                 latency_buckets_ms=None, max_value_ms: float = 3_600_000):
+        self.path = path or _default_path(name)
+        self.max_workers = max_workers
+        self.latency_buckets_ms = tuple(latency_buckets_ms or METRICS_LATENCY_BUCKETS_MS)
+        self._max_value_ms = max_value_ms
+        self._max_value = int(max_value_ms * 1000)
+        self._hdr_offset = _BUCKETS + len(self.latency_buckets_ms) + 1
+        self._slot_len = self._hdr_offset + _bucket_index(self._max_value) + 1
+
+        self._pid: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._slot: int = 0
+
+    # --- Подключение к области ---
+
+    def _size(self) -> int:
+        return 8 * (_HEADER_LEN + self.max_workers * self._slot_len)
+
+    def _ensure_attached(self):
+        # После fork каждый воркер подключается заново и занимает собственный слот
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        size = self._size()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, size)
+                self._mm = mmap.mmap(fd, size)
+                self._view = memoryview(self._mm).cast("Q")
+                self._claim_slot()
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _slot_base(self, slot: int) -> int:
+        return _HEADER_LEN + slot * self._slot_len
+
+    def _header(self) -> tuple:
+        return _MAGIC, _VERSION, self.max_workers, self._slot_len
+
+    def _claim_slot(self):
+        v = self._view
+        header = self._header()
+        if tuple(v[:_HEADER_LEN]) != header:
+            # Новая область или область с другой раскладкой: ее счетчики прочитать нельзя
+            self._mm[:] = bytes(len(self._mm))
+            for i, x in enumerate(header):
+                v[i] = x
+            self._reset_counters()
+
+        started = _process_start_time(self._pid)
+        for i in range(self.max_workers):
+            base = self._slot_base(i)
+            pid = v[base + _PID]
+            if (pid == self._pid and v[base + _STARTED] == started) or not _owner_alive(pid, v[base + _STARTED]):
+                # Счетчики умершего воркера сохраняем, сбрасываем лишь его незавершенные запросы
+                v[base + _IN_FLIGHT] = 0
+                v[base + _PID] = self._pid
+                v[base + _STARTED] = started
+                self._slot = base
+                return
+        raise RuntimeError(f"Нет свободных слотов в {self.path} (max_workers={self.max_workers})")
+
+    def _reset_counters(self):
+        v = self._view
+        for i in range(self.max_workers):
+            base = self._slot_base(i)
+            v[base + _TOTAL:base + self._slot_len] = memoryview(bytes(8 * (self._slot_len - _TOTAL))).cast("Q")
+            v[base + _MIN_US] = _U64_MAX
+
+    def reset(self):
+        """
+        Явное обнуление счетчиков всех воркеров (слоты остаются за владельцами). Запросы, которые воркеры
+        записывают в этот момент, могут частично потеряться.
+        """
+        self._ensure_attached()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self._reset_counters()
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    # --- Запись (только в свой слот) ---
+
+    def inc_in_flight(self):
+        self._ensure_attached()
+        self._view[self._slot + _IN_FLIGHT] += 1
+
+    def dec_in_flight(self):
+        self._ensure_attached()
+        v = self._view
+        if v[self._slot + _IN_FLIGHT]:
+            v[self._slot + _IN_FLIGHT] -= 1
+
+    def record(self, status_code: int, elapsed_ms: float):
+        self._ensure_attached()
+        v = self._view
+        base = self._slot
+        us = min(max(int(elapsed_ms * 1000), 0), self._max_value)
+        v[base + _TOTAL] += 1
+        v[base + _STATUSES + min(max(status_code // 100, 1), 5) - 1] += 1
+        v[base + _SUM_US] += us
+        if us < v[base + _MIN_US]:
+            v[base + _MIN_US] = us
+        if us > v[base + _MAX_US]:
+            v[base + _MAX_US] = us
+        v[base + _BUCKETS + bisect.bisect_left(self.latency_buckets_ms, elapsed_ms)] += 1
+        v[base + self._hdr_offset + _bucket_index(us)] += 1
+
+    # --- Чтение (по всем воркерам) ---
+
+    def aggregate(self) -> Dict[str, Any]:
+        """Сводка по всем воркерам"""
+        self._ensure_attached()
+        v = self._view
+        latency = LatencyHistogram(self._max_value_ms)
+        counts = latency.counts
+        hdr_len = len(counts)
+        statuses = [0] * 5
+        buckets = [0] * (len(self.latency_buckets_ms) + 1)
+        workers = 0
+        in_flight = 0
+        min_us = _U64_MAX
+        max_us = 0
+
+        for i in range(self.max_workers):
+            base = self._slot_base(i)
+            pid = v[base + _PID]
+            if not pid:
+                continue
+            if _owner_alive(pid, v[base + _STARTED]):
+                workers += 1
+                in_flight += v[base + _IN_FLIGHT]
+            if not v[base + _TOTAL]:
+                continue
+            latency.total += v[base + _TOTAL]
+            latency.sum_ms += v[base + _SUM_US] / 1000
+            min_us = min(min_us, v[base + _MIN_US])
+            max_us = max(max_us, v[base + _MAX_US])
+            for j in range(5):
+                statuses[j] += v[base + _STATUSES + j]
+            for j in range(len(buckets)):
+                buckets[j] += v[base + _BUCKETS + j]
+            hdr = v[base + self._hdr_offset:base + self._hdr_offset + hdr_len]
+            for j, c in enumerate(hdr):
+                if c:
+                    counts[j] += c
+
+        if latency.total:
+            latency.min_ms = min_us / 1000
+            latency.max_ms = max_us / 1000
+
+        return {
+            "workers": workers,
+            "total_requests": latency.total,
+            "statuses": {f"{j + 1}xx": c for j, c in enumerate(statuses) if c},
+            "in_flight": in_flight,
+            "latency": latency.summary(),
+            "latency_sum_ms": latency.sum_ms,
+            "latency_buckets": buckets
+        }
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._pid = None
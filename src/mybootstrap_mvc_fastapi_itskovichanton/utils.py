@@ -1,9 +1,10 @@
+import asyncio
 import base64
 import binascii
-import json
-import re
-from dataclasses import is_dataclass, dataclass
-from typing import Optional, Union, Dict, Any
+from contextvars import ContextVar
+from dataclasses import is_dataclass
+from typing import Optional, Union, Dict, Any, Callable, Awaitable, Iterable, Iterator, AsyncIterable, \
+    AsyncIterator, Mapping
 
 import requests
 from dacite import from_dict, Config
@@ -11,17 +12,28 @@ from fastapi import Request
 from pydantic import BaseModel, Extra
 from src.mybootstrap_core_itskovichanton.utils import is_listable
 from src.mybootstrap_core_itskovichanton.validation import ValidationException
+from src.mybootstrap_mvc_fastapi_itskovichanton import encoders, decoders
+from src.mybootstrap_mvc_fastapi_itskovichanton.masking import SensitiveDataMasker
 from src.mybootstrap_mvc_itskovichanton.exceptions import CoreException, ERR_REASON_VALIDATION, \
     ERR_REASON_SERVER_RESPONDED_WITH_ERROR, ERR_REASON_INTERNAL, ERR_REASON_SERVER_RESPONDED_WITH_ERROR_NOT_FOUND
 from src.mybootstrap_mvc_itskovichanton.pipeline import Call
 from starlette.authentication import AuthenticationError
-from starlette.responses import Response
+
+
+# Запрос, обрабатываемый в текущем контексте: нужен презентерам, которые получают только Result.
+# Выставляется и сбрасывается middleware_context.RequestContextMiddleware
+_current_request: ContextVar[Optional[Request]] = ContextVar("current_request", default=None)
 
 
 def get_call_from_request(request: Request) -> Call:
     return Call(request=request, ip=get_ip(request), user_agent=request.headers.get("User-Agent"))
 
 
+def current_request() -> Optional[Request]:
+    """Обрабатываемый запрос (нужен RequestContextMiddleware), None - вне запроса или без middleware"""
+    return _current_request.get()
+
+
 def get_ip(request: Request):
     for header in ("X-Forwarded-For", "X-Real-Ip"):
         h = request.headers.get(header)
@@ -64,14 +76,30 @@ def get_basic_auth(conn) -> (str, str):
     return username, password
 
 
-def parse_response(r: dict | requests.models.Response | str, reason_mapping: dict[str, str] = None, cl=None):
+def _is_http_response(r) -> bool:
+    """Ответ HTTP-клиента: requests.Response или совместимый по интерфейсу (например, httpx.Response)"""
+    return isinstance(r, requests.models.Response) or \
+        (hasattr(r, "status_code") and hasattr(r, "headers") and hasattr(r, "content"))
+
+
+def parse_response(r: dict | requests.models.Response | str | bytes, reason_mapping: dict[str, str] = None, cl=None,
+                   content_type: str = None):
     if type(r) == str:
-        r = json.loads(r)
+        r = encoders.decode_body(r)
+    elif isinstance(r, (bytes, bytearray)):
+        r = encoders.decode_body(r, content_type)
     http_code = 0
-    if isinstance(r, requests.models.Response):
+    if _is_http_response(r):
         http_code = r.status_code
         try:
-            r = r.json()
+            media_type = encoders.media_type_of(r.headers.get("Content-Type"))
+            try:
+                r = encoders.decode_body(r.content, media_type)
+            except ValueError:
+                if media_type in encoders.BINARY_MEDIA_TYPES:
+                    raise
+                # Например, JSON не в UTF-8 - кодировку определит сам клиент
+                r = r.json()
         except:
             msg = r.text
             if 200 <= r.status_code <= 300:
@@ -79,6 +107,20 @@ def parse_response(r: dict | requests.models.Response | str, reason_mapping: dic
             else:
                 r = {"error": {"message": msg}}
 
+    _raise_for_error(r, reason_mapping, http_code)
+
+    r = r.get("result")
+    if cl:
+        if is_listable(r) or (isinstance(r, Mapping) and is_dataclass(cl)):
+            # Декодер компилируется один раз на тип и переиспользуется
+            r = decoders.decode(r, cl)
+        else:
+            r = from_dict(data_class=cl, data=r, config=Config(check_types=False))
+    return r
+
+
+def _raise_for_error(r: dict, reason_mapping: dict[str, str] = None, http_code: int = 0):
+    """Исключение по полям detail/error ответа сервиса"""
     detail = r.get("detail")
     if detail:
         raise CoreException(message=detail,
@@ -95,17 +137,39 @@ def parse_response(r: dict | requests.models.Response | str, reason_mapping: dic
                                       param=error.get("param"), invalid_value=error.get("invalidValue"))
         raise CoreException(**error)
 
-    r = r.get("result")
-    if cl:
-        if is_listable(r):
-            @dataclass
-            class _Wrapped:
-                value: cl
 
-            r = from_dict(data_class=_Wrapped, data={"value": r}, config=Config(check_types=False)).value
-        else:
-            r = from_dict(data_class=cl, data=r, config=Config(check_types=False))
-    return r
+def iter_response_items(chunks: Iterable[bytes], item_cl=None, reason_mapping: dict[str, str] = None,
+                        http_code: int = 0) -> Iterator[Any]:
+    """
+    Потоковый вариант parse_response для JSON-ответа со списком в result: элементы отдаются (приведенные
+    к item_cl - типу элемента) по мере прихода порций тела, ответ целиком в памяти не собирается.
+    Ошибка сервиса (error/detail) поднимается так же, как в parse_response, как только она разобрана.
+    """
+    parser = decoders.ResultStreamParser()
+    f = decoders.decoder_for(item_cl) if item_cl else None
+    for chunk in chunks:
+        items = parser.feed(chunk)
+        _raise_for_error(parser.members, reason_mapping, http_code)
+        yield from map(f, items) if f else items
+    items = parser.close()
+    _raise_for_error(parser.members, reason_mapping, http_code)
+    yield from map(f, items) if f else items
+
+
+async def aiter_response_items(chunks: AsyncIterable[bytes], item_cl=None, reason_mapping: dict[str, str] = None,
+                               http_code: int = 0) -> AsyncIterator[Any]:
+    """Асинхронный вариант iter_response_items"""
+    parser = decoders.ResultStreamParser()
+    f = decoders.decoder_for(item_cl) if item_cl else None
+    async for chunk in chunks:
+        items = parser.feed(chunk)
+        _raise_for_error(parser.members, reason_mapping, http_code)
+        for item in items:
+            yield f(item) if f else item
+    items = parser.close()
+    _raise_for_error(parser.members, reason_mapping, http_code)
+    for item in items:
+        yield f(item) if f else item
 
 
 async def get_params_from_request(request: Request) -> dict:
@@ -148,99 +212,148 @@ def get_middleware_instances(app):
     return instances
 
 
-async def _recreate_body_iterator(body: bytes):
-    """Воссоздание итератора тела"""
-    yield body
+def _sanitize_and_truncate(text: str, masker: Optional[SensitiveDataMasker] = None,
+                           max_field_len: int = 1000) -> str:
+    """Очистка чувствительных данных и усечение строки"""
+    # Сначала усекаем, затем маскируем чувствительные данные (оборванное значение тоже маскируется)
+    truncated = len(text) > max_field_len
+    text = _mask_sensitive_data(text[:max_field_len], masker)
+    return text + "...[truncated]" if truncated else text
 
 
-def _sanitize_and_truncate(text: str, sensitive_patterns=[], max_field_len: int = 1000) -> str:
-    """Очистка чувствительных данных и усечение строки"""
-    # Сначала усекаем
-    if len(text) > max_field_len:
-        text = text[:max_field_len] + "...[truncated]"
-
-    # Затем маскируем чувствительные данные
-    return _mask_sensitive_data(text, sensitive_patterns)
-
-
-def _mask_sensitive_data(text: str, _sensitive_patterns) -> str:
-    """Маскировка чувствительных данных в тексте"""
-    # Простая маскировка паролей в JSON
-    for pattern in _sensitive_patterns:
-        if pattern.search(text):
-            # Ищем и маскируем значения чувствительных полей
-            text = re.sub(
-                r'("' + pattern.pattern + r'"\s*:\s*)"([^"]*)"',
-                r'\1"***MASKED***"',
-                text,
-                flags=re.IGNORECASE
-            )
-    return text
-
-
-async def _read_response_body(response: Response, max_len=-1) -> Optional[Union[str, bytes]]:
-    """Чтение тела ответа"""
-    try:
+def _mask_sensitive_data(text: str, masker: Optional[SensitiveDataMasker]) -> str:
+    """Маскировка чувствительных данных в тексте (JSON, form-urlencoded, query-строка)"""
+    return masker.mask_text(text) if masker else text
+
+
+class _BodyTee:
+    """Накопитель начала тела ответа: сохраняет для лога только первые max_len байт, остальное лишь считает"""
+
+    def __init__(self, max_len: int):
+        self.max_len = max_len
+        self.head = bytearray()
+        self.total = 0
+
+    def feed(self, chunk: bytes):
+        self.total += len(chunk)
+        free = self.max_len - len(self.head)
+        if free > 0:
+            self.head += chunk[:free]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head)
 
-        # Клонируем ответ для чтения тела
-        body = b""
-        async for chunk in response.body_iterator:
-            if max_len > 0 and len(body) >= max_len:
-                break
-            body += chunk
 
-        # Восстанавливаем итератор
-        response.body_iterator = _recreate_body_iterator(body)
+# Задачи, запущенные в фоне: event loop хранит на них только слабые ссылки
+_background_tasks = set()
+
+
+def _run_in_background(coro: Awaitable):
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        # Event loop уже остановлен
+        coro.close()
+        return
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 
+async def _tee_body_iterator(body_iterator, tee: _BodyTee, on_complete: Callable[[], Awaitable]):
+    """
+    Пропускает чанки тела ответа без изменений, попутно отдавая их в tee.
+    on_complete вызывается после последнего чанка; если отправка оборвалась (клиент отключился, генератор
+    закрыт сборщиком мусора), - отдельной задачей: ждать внутри finally закрываемого генератора нельзя.
+    """
+    completed = False
+    try:
+        async for chunk in body_iterator:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            tee.feed(chunk)
+            yield chunk
+        completed = True
+    finally:
+        if not completed:
+            _run_in_background(on_complete())
+    await on_complete()
+
+
+def _decode_response_body(tee: _BodyTee, content_type: Optional[str],
+                          masker: Optional[SensitiveDataMasker] = None) -> Optional[str]:
+    """Представление захваченного начала тела ответа для лога"""
+    try:
         # Если тело пустое
-        if not body:
+        if not tee.total:
             return None
 
         # Пробуем декодить как текст
-        content_type = response.headers.get('content-type', '').lower()
+        content_type = (content_type or '').lower()
         if 'application/json' in content_type or 'text/' in content_type:
             try:
-                text_body = body.decode('utf-8')
-                max_field_len = 3000 if 500 <= response.status_code < 600 else 1500
-                return _sanitize_and_truncate(text_body, max_field_len=max_field_len)
+                # Усеченное тело могло оборваться посреди многобайтного символа
+                text_body = _mask_sensitive_data(
+                    tee.head.decode('utf-8', errors='ignore' if tee.truncated else 'strict'), masker)
+                if tee.truncated:
+                    text_body += "...[truncated]"
+                return text_body
             except (UnicodeDecodeError, UnicodeEncodeError):
                 pass
 
         # Для бинарных данных возвращаем информацию о размере
-        return f"bytes[{len(body)}]"
+        return f"bytes[{tee.total}]"
 
     except Exception as e:
         return f"error_reading_body: {str(e)}"
 
 
-async def _read_request_body(request: Request, _sensitive_patterns, max_field_len) -> Optional[Union[str, bytes]]:
-    """Асинхронное чтение тела запроса с кэшированием"""
+async def _read_request_body(request: Request) -> Optional[Union[str, bytes]]:
+    """Асинхронное чтение сырого тела запроса (starlette кэширует его для обработчика)"""
     try:
         # Проверяем, есть ли тело
         if request.method not in ("POST", "PUT", "PATCH"):
             return None
 
-        # Читаем тело
-        body = await request.body()
+        return await request.body()
 
-        # Если это байты и не текст, возвращаем информацию о размере
-        if isinstance(body, bytes):
-            # Пробуем декодить как текст
-            try:
-                text_body = body.decode('utf-8')
-                # Проверяем, не содержит ли тело бинарные данные
-                if _is_likely_text(text_body):
-                    return _sanitize_and_truncate(text_body, _sensitive_patterns, max_field_len)
-            except (UnicodeDecodeError, UnicodeEncodeError):
-                pass
+    except Exception as e:
+        return f"error_reading_body: {str(e)}"
 
-            # Если не удалось декодить как текст, возвращаем информацию о размере
-            return f"bytes[{len(body)}]"
 
+def _render_request_body(body: Optional[Union[str, bytes]], masker: Optional[SensitiveDataMasker],
+                         max_field_len) -> Optional[Union[str, bytes]]:
+    """Представление тела запроса для лога: усечение, проверка на бинарность и маскировка"""
+    if not isinstance(body, bytes):
         return body
 
-    except Exception as e:
-        return f"error_reading_body: {str(e)}"
+    # Декодим только ту часть, что попадет в лог
+    truncated = len(body) > max_field_len
+    try:
+        text_body = body[:max_field_len].decode('utf-8', errors='ignore' if truncated else 'strict')
+        # Проверяем, не содержит ли тело бинарные данные
+        if _is_likely_text(text_body):
+            text_body = _mask_sensitive_data(text_body, masker)
+            if truncated:
+                text_body += "...[truncated]"
+            return text_body
+    except (UnicodeDecodeError, UnicodeEncodeError):
+        pass
+
+    # Если не удалось декодить как текст, возвращаем информацию о размере
+    return f"bytes[{len(body)}]"
+
+
+# Ключ для запросов, не попавших ни в один маршрут: сырые пути не должны плодить ключи в статистике и политиках
+ROUTE_UNMATCHED = "<unmatched>"
+
+
+def _get_route_template(scope) -> str:
+    """Шаблон сработавшего маршрута (например, /search1/{table}); до роутинга или без маршрута - ROUTE_UNMATCHED"""
+    path = getattr(scope.get("route"), "path", None)
+    if not path:
+        return ROUTE_UNMATCHED
+    return scope.get("root_path", "") + path
 
 
 def _is_likely_text(text: str) -> bool:
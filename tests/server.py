@@ -8,6 +8,7 @@ from src.mybootstrap_ioc_itskovichanton.ioc import bean
 
 from controller import TestController, TestController2
 from src.mybootstrap_mvc_fastapi_itskovichanton import utils
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_context import RequestContextMiddleware
 from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_logging import HTTPLoggingMiddleware, HTTPLogLineCompiler
 
 
@@ -52,6 +53,8 @@ class TestServer:
                                 # log_line_compiler=CompactHTTPLogLineCompiler(),
                                 encoding="utf-8",
                                 logger=self.logger_service.get_file_logger("http"))
+        # Последний добавленный - самый внешний: запрос доступен презентерам и остальным middleware
+        fast_api.add_middleware(RequestContextMiddleware)
 
         @fast_api.get("/search1/{table}")
         async def m1(table: str, request: Request, q: str = None, limit: int = 0, count: int = 100):
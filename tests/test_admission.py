@@ -0,0 +1,20 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_admission import AdmissionControlMiddleware
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import get_middleware_instances
+
+
+def test_route_limiter_key_includes_root_path():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(AdmissionControlMiddleware, route_limits={"/api/items/{item_id}": 3})
+    client = TestClient(app, root_path="/api")
+    assert client.get("/api/items/1").json() == {"id": 1}
+    assert client.get("/api/items/2").json() == {"id": 2}
+    admission = next(m for m in get_middleware_instances(app) if isinstance(m, AdmissionControlMiddleware))
+    assert admission.stats() == {"/api/items/{item_id}": {"limit": 3, "in_flight": 0, "queued": 0, "admitted": 2,
+                                                          "rejected": 0, "timed_out": 0}}
@@ -0,0 +1,62 @@
+import array
+import asyncio
+
+import pytest
+from src.mybootstrap_mvc_fastapi_itskovichanton.files import ZEROCOPY_EXTENSION
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import BytesResultPresenterImpl
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+
+
+def _send(response, extensions=None) -> list:
+    bodies = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            bodies.append(message["body"])
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    scope = {"type": "http", "method": "GET", "extensions": extensions or {}}
+    asyncio.run(response(scope, receive, send))
+    return bodies
+
+
+def _present(result):
+    return BytesResultPresenterImpl().present(Result(result=result))
+
+
+@pytest.mark.parametrize("result, expected", [
+    (bytearray(b"0123456789"), b"0123456789"),
+    (memoryview(bytearray(b"0123456789"))[::2], b"02468"),
+    (array.array("H", [1, 2]), array.array("H", [1, 2]).tobytes()),
+])
+def test_buffers_are_sent_as_bytes(result, expected):
+    bodies = _send(_present(result))
+    assert all(type(b) is bytes for b in bodies)
+    assert b"".join(bodies) == expected
+
+
+def test_buffers_are_sent_without_copy_on_zerocopy_servers():
+    bodies = _send(_present(bytearray(b"0123456789")), {ZEROCOPY_EXTENSION: {}})
+    assert [type(b) for b in bodies] == [memoryview]
+    assert bytes(bodies[0]) == b"0123456789"
+
+
+def test_streamed_chunks_are_sent_as_bytes():
+    bodies = _send(_present([memoryview(b"ab"), bytearray(b"cd"), "ef"]))
+    assert all(type(b) is bytes for b in bodies)
+    assert b"".join(bodies) == b"abcdef"
+
+
+def test_mappings_are_rejected():
+    with pytest.raises(TypeError):
+        _present({"a": b"1"})
+
+
+def test_non_buffer_chunks_are_rejected():
+    async def consume(chunks):
+        return [c async for c in chunks]
+
+    with pytest.raises(TypeError):
+        asyncio.run(consume(_present([b"ab", 1]).body_iterator))
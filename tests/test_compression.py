@@ -0,0 +1,45 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_context import RequestContextMiddleware
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import CompressingResultPresenterImpl
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+
+_ROWS = [{"id": i, "title": f"row {i}"} for i in range(200)]
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    presenter = CompressingResultPresenterImpl(encodings=("gzip",))
+
+    @app.get("/rows")
+    async def rows(n: int = len(_ROWS)):
+        return presenter.present(Result(result=_ROWS[:n]))
+
+    app.add_middleware(RequestContextMiddleware)
+    return TestClient(app)
+
+
+def test_compresses_by_accept_encoding():
+    r = _client().get("/rows", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) < len(r.content)
+    assert r.json() == {"result": _ROWS}
+
+
+def test_uncompressed_responses_vary_on_accept_encoding():
+    client = _client()
+    for headers, n in (({"Accept-Encoding": "identity"}, len(_ROWS)), ({"Accept-Encoding": "gzip"}, 1)):
+        r = client.get("/rows", params={"n": n}, headers=headers)
+        assert "content-encoding" not in r.headers
+        assert r.headers["vary"] == "Accept-Encoding"
+        assert r.json() == {"result": _ROWS[:n]}
+
+
+def test_compressed_body_is_gzip():
+    client = _client()
+    with client.stream("GET", "/rows", headers={"Accept-Encoding": "gzip"}) as r:
+        raw = b"".join(r.iter_raw())
+    assert gzip.decompress(raw) == client.get("/rows", headers={"Accept-Encoding": "identity"}).content
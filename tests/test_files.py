@@ -0,0 +1,50 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_context import RequestContextMiddleware
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import AnyResultPresenterImpl
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+
+_CONTENT = b"0123456789" * 100
+
+
+def _client(path: str, with_middleware: bool) -> TestClient:
+    app = FastAPI()
+    presenter = AnyResultPresenterImpl()
+
+    @app.get("/file")
+    async def file():
+        return presenter.present(Result(result=path))
+
+    @app.get("/explicit")
+    async def explicit(request: Request):
+        return presenter.present(Result(result=path), request)
+
+    if with_middleware:
+        app.add_middleware(RequestContextMiddleware)
+    return TestClient(app)
+
+
+def _check_conditional_and_range(client: TestClient, url: str):
+    r = client.get(url)
+    assert r.status_code == 200 and r.content == _CONTENT
+    etag = r.headers["etag"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    r = client.get(url, headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 10-19/{len(_CONTENT)}"
+    assert r.content == _CONTENT[10:20]
+
+
+def test_conditional_get_and_range_with_middleware(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(_CONTENT)
+    _check_conditional_and_range(_client(str(path), True), "/file")
+
+
+def test_conditional_get_and_range_with_explicit_request(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(_CONTENT)
+    client = _client(str(path), False)
+    _check_conditional_and_range(client, "/explicit")
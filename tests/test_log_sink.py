@@ -0,0 +1,62 @@
+import io
+import logging
+
+from src.mybootstrap_mvc_fastapi_itskovichanton.log_sink import QueuedLogSink
+
+
+class _CountingStream(io.StringIO):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class _ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def _logger(name, *handlers) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def test_stream_handler_writes_a_batch_at_once():
+    stream = _CountingStream()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    other = _ListHandler()
+    sink = QueuedLogSink(_logger("test-log-sink-batch", handler, other))
+
+    sink._write_batch([{"n": i} for i in range(100)])
+
+    assert (stream.writes, stream.flushes) == (1, 1)
+    assert stream.getvalue().splitlines() == [f"INFO {{'n': {i}}}" for i in range(100)]
+    assert other.messages == [str({"n": i}) for i in range(100)]
+    assert sink.stats()["written"] == 100
+
+
+def test_sink_writes_all_records_on_close():
+    stream = _CountingStream()
+    sink = QueuedLogSink(_logger("test-log-sink-close", logging.StreamHandler(stream)), batch_size=64)
+    for i in range(1000):
+        assert sink.put(f"r{i}")
+    sink.close()
+    assert stream.getvalue().splitlines() == [f"r{i}" for i in range(1000)]
+    assert stream.writes == stream.flushes <= 1000
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from src.mybootstrap_mvc_fastapi_itskovichanton.masking import SensitiveDataMasker
+
+_MASKER = SensitiveDataMasker({"password", "token"})
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"password": "p", "password_hint": "h"}', '{"password": "***MASKED***", "password_hint": "h"}'),
+    ('{"password": ["a", "b"], "n": 1}', '{"password": "***MASKED***", "n": 1}'),
+    ('{"token": {"x": 1}}', '{"token": "***MASKED***"}'),
+    ('{"token": {"x": "}", "password": ["]"]}, "n": [1]}', '{"token": "***MASKED***", "n": [1]}'),
+    ('{"Password": [{"a": "\\"]"}], "n": 1}', '{"Password": "***MASKED***", "n": 1}'),
+    ('password=p&token=t&n=1', 'password=***MASKED***&token=***MASKED***&n=1'),
+])
+def test_masks_values(text, expected):
+    assert _MASKER.mask_text(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"password": "trunc', '{"password": "***MASKED***"'),
+    ('{"password": "tr\\', '{"password": "***MASKED***"'),
+    ('{"password": ["a", "b', '{"password": "***MASKED***"'),
+    ('{"token": {"x": {"y": 1}', '{"token": "***MASKED***"'),
+])
+def test_masks_truncated_values(text, expected):
+    assert _MASKER.mask_text(text) == expected
+
+
+def test_masks_json_serialized_into_a_string():
+    inner = json.dumps({"password": ["a", "b]"], "token": {"k": "}"}, "n": 1})
+    masked = json.loads(_MASKER.mask_text(json.dumps({"body": inner})))
+    assert json.loads(masked["body"]) == {"password": "***MASKED***", "token": "***MASKED***", "n": 1}
+    # Усечение посреди массива не оставляет его элементов
+    assert _MASKER.mask_text(json.dumps({"body": inner})[:30]) == '{"body": "{\\"password\\": \\"***MASKED***\\"'
+
+
+def test_masked_json_stays_valid():
+    doc = {"user": {"password": ["a", {"b": "c"}], "token": {"t": [1, 2]}, "name": "n"}, "items": [1, 2]}
+    assert json.loads(_MASKER.mask_text(json.dumps(doc))) == \
+           {"user": {"password": "***MASKED***", "token": "***MASKED***", "name": "n"}, "items": [1, 2]}
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import decimal
+import enum
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from src.mybootstrap_core_itskovichanton.utils import to_dict_deep
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import JSONResultPresenterImpl, XMLResultPresenterImpl, \
+    ThreadpoolRenderedResponse, xml_serializer_config
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import to_pydantic_model
+from src.mybootstrap_mvc_itskovichanton.error_provider import Err
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+@dataclass
+class Row:
+    title: str
+    when: datetime.datetime = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    day: datetime.date = datetime.date(2024, 1, 2)
+    color: Color = Color.RED
+    price: decimal.Decimal = decimal.Decimal("1.50")
+    note: Optional[str] = None
+
+
+def _results():
+    return [
+        Result(result=[Row("a"), Row("b", note="n")]),
+        Result(result={"price": decimal.Decimal("2.50"), "when": datetime.datetime(2024, 5, 6), "color": Color.RED}),
+        Result(error=Err(message="bad", reason="R")),
+    ]
+
+
+def _body(presenter: JSONResultPresenterImpl, r: Result):
+    return json.loads(presenter.present(r).body)
+
+
+def _legacy(r: Result, to_dict: bool = False, **kwargs):
+    return json.loads(json.dumps(jsonable_encoder(to_dict_deep(r) if to_dict else to_pydantic_model(r),
+                                                  exclude_none=True, by_alias=True, sqlalchemy_safe=True, **kwargs)))
+
+
+def test_default_path_matches_jsonable_encoder():
+    for r in _results():
+        assert _body(JSONResultPresenterImpl(), r) == _legacy(r)
+        assert _body(JSONResultPresenterImpl(to_dict=True), r) == _legacy(r, to_dict=True)
+
+
+def test_default_path_keeps_custom_encoder_semantics():
+    custom_encoder = {Color: lambda c: c.name, decimal.Decimal: float}
+    for r in _results():
+        assert _body(JSONResultPresenterImpl(custom_encoder=custom_encoder), r) == \
+               _legacy(r, custom_encoder=custom_encoder)
+
+
+def test_encoder_cache_matches_default_for_dataclasses_datetime_and_enum():
+    r = Result(result=[{"title": "a", "when": datetime.datetime(2024, 1, 2, 3, 4, 5),
+                        "day": datetime.date(2024, 1, 2), "color": Color.RED}, Row("b", price=None)])
+    assert _body(JSONResultPresenterImpl(use_encoder_cache=True), r) == _body(JSONResultPresenterImpl(), r)
+
+
+def test_encoder_cache_renders_decimal_as_string():
+    r = Result(result={"price": decimal.Decimal("2.50")})
+    assert _body(JSONResultPresenterImpl(use_encoder_cache=True), r) == {"result": {"price": "2.50"}}
+
+
+def test_encoder_cache_applies_nested_include_and_exclude():
+    r = Result(result=[Row("a"), Row("b", note="n")], error=Err(message="bad", reason="R"))
+    specs = [dict(exclude={"error": {"reason"}}),
+             dict(exclude={"result": {"__all__": {"price", "when"}}}),
+             dict(include={"result": {0: {"title"}}, "error": True})]
+    for spec in specs:
+        assert _body(JSONResultPresenterImpl(use_encoder_cache=True, **spec), r) == \
+               _body(JSONResultPresenterImpl(**spec), r)
+    body = _body(JSONResultPresenterImpl(use_encoder_cache=True, exclude={"error": {"reason"}}), r)
+    assert body["error"] == {"message": "bad"}
+
+
+class _Unencodable:
+    def __init__(self):
+        self.me = self
+
+
+def test_default_path_removes_unencodable_error_fields():
+    err = Err(message="bad", reason="R")
+    err.cause = _Unencodable()
+    body = _body(JSONResultPresenterImpl(), Result(error=err))
+    assert body["error"]["message"] == "bad"
+    assert body["error"]["reason"] == "R"
+    assert "cause" not in body["error"]
+
+
+def test_default_path_encodes_error_with_several_bad_fields_in_one_attempt():
+    err = Err(message="bad", reason="R", cause=_Unencodable())
+    err.extra = _Unencodable()
+    err.code = 42
+    presenter = JSONResultPresenterImpl()
+    calls = []
+    render = presenter._render
+    presenter._render = lambda r, degraded: calls.append(r) or render(r, degraded)
+    body = json.loads(presenter.present(Result(error=err)).body)
+    assert len(calls) == 1
+    assert body["error"] == {"message": "bad", "reason": "R", "code": 42}
+
+
+async def _send_body(response) -> bytes:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http"}, None, send)
+    headers = dict(messages[0]["headers"])
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    assert int(headers[b"content-length"]) == len(body)
+    return body
+
+
+@dataclass
+class Feed:
+    title: str
+
+
+@dataclass
+class Feeds:
+    feed: List[Feed] = field(default_factory=list, metadata={"type": "Element"})
+
+
+def test_xml_offloaded_render_matches_inline_render():
+    doc = Feeds([Feed(f"T{i}") for i in range(50)])
+    inline = XMLResultPresenterImpl(offload_min_items=None).present(doc)
+    offloaded = XMLResultPresenterImpl(offload_min_items=10).present(doc)
+    assert isinstance(offloaded, ThreadpoolRenderedResponse)
+    assert asyncio.run(_send_body(offloaded)) == inline.body
+
+
+def test_xml_serializer_config_indents_only_when_pretty():
+    doc = Feeds([Feed("a"), Feed("b")])
+    compact = XMLResultPresenterImpl().present(doc).body
+    pretty = XMLResultPresenterImpl(config=xml_serializer_config(pretty=True)).present(doc).body
+    assert b"\n  <feed>" not in compact
+    assert b"\n  <feed>" in pretty
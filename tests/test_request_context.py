@@ -0,0 +1,54 @@
+import asyncio
+
+import msgpack
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_context import RequestContextMiddleware
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import NegotiatingResultPresenterImpl
+from src.mybootstrap_mvc_fastapi_itskovichanton.utils import current_request
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    presenter = NegotiatingResultPresenterImpl()
+
+    # Контроллер не вызывает get_call_from_request
+    @app.get("/items")
+    async def items():
+        return presenter.present(Result(result={"n": 1}))
+
+    app.add_middleware(RequestContextMiddleware)
+    return TestClient(app)
+
+
+def test_negotiates_without_get_call_from_request():
+    client = _client()
+    r = client.get("/items", headers={"Accept": "application/msgpack"})
+    assert r.headers["content-type"] == "application/msgpack"
+    assert r.headers["vary"] == "Accept"
+    assert msgpack.unpackb(r.content) == {"result": {"n": 1}}
+
+    r = client.get("/items")
+    assert r.headers["content-type"] == "application/json"
+    assert r.json() == {"result": {"n": 1}}
+
+
+def test_request_is_reset_after_response():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(current_request().url.path)
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        ...
+
+    async def request():
+        scope = {"type": "http", "method": "GET", "path": "/path", "query_string": b"", "headers": []}
+        await RequestContextMiddleware(app)(scope, None, send)
+        return current_request()
+
+    assert asyncio.run(request()) is None
+    assert seen == ["/path"]
@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_context import RequestContextMiddleware
+from src.mybootstrap_mvc_fastapi_itskovichanton.presenters import CompressingResultPresenterImpl
+from src.mybootstrap_mvc_fastapi_itskovichanton.result_cache import ResultCache, cached
+from src.mybootstrap_mvc_itskovichanton.pipeline import Result
+from starlette.responses import Response
+
+
+class Controller:
+
+    def __init__(self):
+        self.calls = 0
+        self.presenter = CompressingResultPresenterImpl(encodings=("gzip",))
+
+    @cached(ttl=60)
+    async def rows(self, request: Request, n: int = 100):
+        self.calls += 1
+        return self.presenter.present(Result(result=[{"id": i, "title": f"row {i}"} for i in range(n)]))
+
+
+def _client(controller: Controller) -> TestClient:
+    # Кэш общий для всех экземпляров класса (контроллеры - синглтоны)
+    Controller.rows.cache.invalidate()
+    app = FastAPI()
+
+    @app.api_route("/rows", methods=["GET", "HEAD"])
+    async def rows(request: Request, n: int = 100):
+        return await controller.rows(request, n)
+
+    app.add_middleware(RequestContextMiddleware)
+    return TestClient(app)
+
+
+def test_hits_replay_body_status_and_headers():
+    controller = Controller()
+    client = _client(controller)
+    headers = {"Accept-Encoding": "gzip"}
+    with client.stream("GET", "/rows", headers=headers) as first:
+        first_raw = b"".join(first.iter_raw())
+    for _ in range(3):
+        with client.stream("GET", "/rows", headers=headers) as r:
+            assert r.status_code == first.status_code
+            assert r.headers == first.headers
+            assert b"".join(r.iter_raw()) == first_raw
+    assert controller.calls == 1
+    assert first.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(first_raw).startswith(b'{"result":[{"id":0')
+
+
+def test_key_includes_arguments_and_vary_headers():
+    controller = Controller()
+    client = _client(controller)
+    client.get("/rows", headers={"Accept-Encoding": "gzip"})
+    client.get("/rows", params={"n": 5}, headers={"Accept-Encoding": "gzip"})
+    r = client.get("/rows", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert controller.calls == 3
+    assert controller.rows.cache.stats()["entries"] == 3
+
+
+def test_head_and_get_do_not_share_an_entry():
+    controller = Controller()
+    client = _client(controller)
+    client.head("/rows")
+    r = client.get("/rows")
+    assert r.json()["result"][0] == {"id": 0, "title": "row 0"}
+    assert controller.calls == 2
+    assert controller.rows.cache.stats()["entries"] == 2
+
+
+def test_every_hit_and_coalesced_waiter_gets_a_new_response():
+    cache = ResultCache()
+    calls = 0
+
+    async def run():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return Response(b"body", headers={"x-test": "1"})
+
+    async def main():
+        responses = await asyncio.gather(*(cache.get_or_run("k", run) for _ in range(5)))
+        responses.append(await cache.get_or_run("k", run))
+        return responses
+
+    responses = asyncio.run(main())
+    assert calls == 1
+    assert len({id(r) for r in responses}) == len(responses)
+    assert {(r.status_code, r.body, r.headers["x-test"]) for r in responses} == {(200, b"body", "1")}
+    assert cache.stats()["coalesced"] == 4 and cache.hits == 1
+
+
+def test_non_2xx_responses_are_not_cached():
+    cache = ResultCache()
+
+    async def run():
+        return Response(b"missing", status_code=404)
+
+    async def main():
+        return [await cache.get_or_run("k", run) for _ in range(2)]
+
+    asyncio.run(main())
+    assert cache.misses == 2 and cache.stats()["entries"] == 0
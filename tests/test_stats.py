@@ -0,0 +1,59 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.mybootstrap_mvc_fastapi_itskovichanton.middleware_stats import StatisticsMiddleware, StatsHolder, RequestRing
+
+
+def _app(holder: StatsHolder):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(StatisticsMiddleware, stats_holder=holder)
+    return app
+
+
+def test_snapshot_is_built_on_read_not_on_requests(monkeypatch):
+    holder = StatsHolder()
+    holder.init()
+    client = TestClient(_app(holder))
+    client.get("/items/0")
+    middleware = holder.middleware
+    calls = []
+    get_extended_stats = middleware.get_extended_stats
+    monkeypatch.setattr(middleware, "get_extended_stats", lambda: calls.append(1) or get_extended_stats())
+
+    for i in range(120):
+        client.get(f"/items/{i}")
+    assert calls == []
+
+    assert holder.get()["time"]["extended_metrics"]["total_requests_processed"] == 121
+    client.get("/items/1")
+    holder.get()
+    assert len(calls) == 1
+
+    holder.snapshot_ttl = 0
+    assert holder.get()["time"]["extended_metrics"]["total_requests_processed"] == 122
+    assert len(calls) == 2
+
+
+def test_request_ring_keeps_window_aggregates_without_numpy():
+    ring = RequestRing(100)
+    for i in range(250):
+        ring.append(float(i), None if i % 2 else i / 2, 1000.0 + i, 500 if i % 10 == 0 else 200, i % 3,
+                    None if i % 5 == 0 else 10)
+    window = range(150, 250)
+    avg, min_ms, max_ms = ring.elapsed_aggregates()
+    assert avg == sum(window) / 100
+    assert abs(min_ms - 150) < 3 and abs(max_ms - 249) < 4
+    percentiles = ring.elapsed_percentiles()
+    assert abs(percentiles["p50"] - 199) < 4 and abs(percentiles["p90"] - 239) < 4
+    assert ring.column_summary(["a", "b", "c"]) == {
+        "statuses": {"2xx": 90, "5xx": 10},
+        "top_routes": {"a": 34, "b": 33, "c": 33},
+        "avg_ttfb_ms": sum(i / 2 for i in window if i % 2 == 0) / 50,
+        "avg_content_length": 10.0,
+        "span_seconds": 99.0,
+        "requests_per_second": round(100 / 99, 3),
+    }